@@ -0,0 +1,379 @@
+#!/usr/bin/env python2
+# encoding: utf-8
+
+"""\
+Time the hot paths of show_my_designs on synthetic design directories.
+
+Usage:
+    run_benchmarks.py [options]
+    run_benchmarks.py compare <old_json> <new_json>
+
+Options:
+    -s, --sizes <list>      [default: 50,1000,10000]
+        Comma-separated numbers of models to put in each synthetic design.
+        The largest realistic runs have about 1000000 models.
+
+    -z, --compression <list>    [default: plain,gzip]
+        Comma-separated list of the file formats to benchmark.  Plain models
+        are written as '*.pdb', gzipped models as '*.pdb.gz'.
+
+    -a, --atoms <num>       [default: 500]
+        The number of ATOM records to write into each synthetic model.  Real
+        models have thousands, but that quickly becomes a lot of disk space
+        for the larger benchmarks.
+
+    -r, --repeat <num>      [default: 3]
+        How many times to repeat each measurement.
+
+    -w, --workdir <dir>
+        Where to write the synthetic designs.  Designs that already exist in
+        this directory are reused, which saves a lot of time when comparing
+        several commits.  By default a temporary directory is used and deleted
+        afterwards.
+
+    -o, --output <path>
+        Write the results to the given JSON file instead of stdout.
+
+The 'compare' command prints the ratio between the median timings of two result
+files, e.g. from two different commits.
+"""
+
+import contextlib, gzip, json, os, platform, shutil, subprocess, sys, tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import show_my_designs
+from show_my_designs import gui
+
+
+class BenchmarkFilter (object):
+    """
+    Stand in for `FilterPane.Filter` that doesn't need any GTK widgets.
+    """
+
+    def __init__(self, name, operator, threshold):
+        self.name = name
+        self.operator = operator
+        self.threshold = threshold
+
+    def get_name(self):
+        return self.name
+
+    def get_operator(self):
+        return self.operator
+
+    def get_threshold(self):
+        return self.threshold
+
+    def update_counter(self, num_kept, num_total):
+        pass
+
+    def update_histogram(self, counts, kept_counts, threshold):
+        pass
+
+
+class BenchmarkFilterPane (object):
+    """
+    Stand in for `FilterPane` that doesn't need any GTK widgets.
+    """
+
+    get_masks = gui.FilterPane.get_masks.im_func
+
+    def __init__(self, filters=()):
+        self.master = None
+        self.filters = list(filters)
+
+    def get_action(self):
+        return 'highlight'
+
+
+class BenchmarkHost (object):
+    """
+    Provide the state `ShowMyDesigns.plot_models()` needs without creating a
+    window, so the plot can be rendered with the Agg backend.
+    """
+
+    plot_models = gui.ShowMyDesigns.plot_models.im_func
+    get_plot_options = gui.ShowMyDesigns.get_plot_options.im_func
+    get_metric = gui.ShowMyDesigns.get_metric.im_func
+    get_metric_limits = gui.ShowMyDesigns.get_metric_limits.im_func
+    get_histogram_bins = gui.ShowMyDesigns.get_histogram_bins.im_func
+
+    def __init__(self, designs, filter_pane):
+        self.designs = designs
+        self.filter_pane = filter_pane
+        self.filter_pane.master = self
+        self.is_legend_visible = True
+        self.is_representative_visible = True
+        self.is_model_count_visible = True
+        self.is_pareto_front_visible = True
+        self.is_downsampling_enabled = False
+        self.is_histograms_visible = False
+        self.metric_limits = {}
+        self.histogram_bins = {}
+        self.selected_region = None
+        self.regions = {}
+
+        self.metrics = {
+                k: next(iter(self)).metrics[k]
+                for k in set.intersection(*[set(x.metrics) for x in self])
+        }
+        self.x_metric = 'loop_rmsd'
+        self.y_metric = 'total_score'
+
+    def __iter__(self):
+        return iter(self.designs.values())
+
+
+def make_synthetic_design(directory, num_models, compress, num_atoms, seed=0):
+    """
+    Fill the given directory with fake Rosetta models.  The scores and RMSDs
+    are drawn so that the design has a (noisy) funnel, which is what real
+    designs look like and what the plots are tuned for.
+    """
+    if os.path.exists(os.path.join(directory, 'complete')):
+        return
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    random = np.random.RandomState(seed)
+    rmsds = random.exponential(2.5, size=num_models)
+    scores = -320 + 12 * rmsds + random.normal(0, 6, size=num_models)
+    unsats = random.poisson(5, size=num_models)
+
+    atoms = ''.join(
+            'ATOM  {0:5d}  CA  ALA A{1:4d}    {2:8.3f}{3:8.3f}{4:8.3f}'
+            '  1.00  0.00           C  \n'.format(i + 1, i // 4 + 1, *xyz)
+            for i, xyz in enumerate(random.normal(0, 10, size=(num_atoms, 3))))
+
+    for i in range(num_models):
+        name = 'model_{0:07d}.pdb'.format(i)
+        footer = (
+                'TER\n'
+                '# All scores below are weighted scores, not raw scores.\n'
+                '#BEGIN_POSE_ENERGIES_TABLE {0}\n'
+                'label fa_atr fa_rep total\n'
+                'weights 0.8 0.44 NA\n'
+                'pose -935.093 142.462 {1:.3f}\n'
+                '#END_POSE_ENERGIES_TABLE {0}\n'
+                'delta_buried_unsats {2}\n'
+                'loop_backbone_rmsd {3:.5f}\n'
+                'total_score {1:.3f}\n'.format(
+                    name, scores[i], unsats[i], rmsds[i]))
+
+        if compress:
+            with gzip.open(os.path.join(directory, name + '.gz'), 'wb') as file:
+                file.write(atoms + footer)
+        else:
+            with open(os.path.join(directory, name), 'w') as file:
+                file.write(atoms + footer)
+
+    open(os.path.join(directory, 'complete'), 'w').close()
+
+def clear_cache(directory):
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            os.remove(os.path.join(directory, name))
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Hide the progress messages that show_my_designs prints while parsing.
+    """
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try: yield
+        finally: sys.stdout = stdout
+
+def time_call(function, repeat, setup=None):
+    times = []
+    for i in range(repeat):
+        if setup: setup()
+        with quiet():
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+    return times
+
+def run_benchmarks(directory, num_models, compress, repeat):
+    results = []
+
+    def record(name, times): #
+        results.append({
+            'benchmark': name,
+            'num_models': num_models,
+            'compression': 'gzip' if compress else 'plain',
+            'times': times,
+            'min': min(times),
+            'median': float(np.median(times)),
+        })
+        sys.stderr.write("{0:>32s}  {1:>8d}  {2:>5s}  {3:9.4f}s\n".format(
+            name, num_models, results[-1]['compression'], min(times)))
+
+    pdb_paths = sorted(
+            os.path.join(directory, x)
+            for x in os.listdir(directory) if '.pdb' in x)
+
+    record('parse_records_from_pdbs', time_call(
+        lambda: gui.parse_records_from_pdbs(pdb_paths), repeat))
+
+    record('Design._load_models (cold)', time_call(
+        lambda: gui.Design(directory, use_cache=True), repeat,
+        setup=lambda: clear_cache(directory)))
+
+    record('Design._load_models (warm)', time_call(
+        lambda: gui.Design(directory, use_cache=True), repeat))
+
+    with quiet():
+        design = gui.Design(directory)
+
+    score = design.get_metric('total_score')
+    filter_pane = BenchmarkFilterPane([
+        BenchmarkFilter('total_score', '<', str(np.median(score))),
+        BenchmarkFilter('loop_rmsd', '<=', '2.0'),
+        BenchmarkFilter('delta_buried_unsats', '!=', '0'),
+    ])
+    host = BenchmarkHost({directory: design}, filter_pane)
+
+    record('FilterPane.get_masks', time_call(
+        lambda: filter_pane.get_masks(design), repeat))
+
+    export_path = os.path.join(directory, 'export.csv.gz')
+    record('export_models (gzip)', time_call(
+        lambda: gui.export_models(
+            export_path, [design], lambda x: filter_pane.get_masks(x)[0]),
+        repeat))
+    os.remove(export_path)
+
+    figure = Figure(figsize=(10.2, 6.3), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    axes = figure.add_axes((0.15, 0.15, 0.75, 0.75))
+
+    def plot(): #
+        host.plot_models(axes, [design], labels=[directory])
+        canvas.draw()
+
+    record('plot_models (Agg)', time_call(plot, repeat))
+
+    histogram_axes = (
+            figure.add_axes(gui.x_histogram_position, sharex=axes),
+            figure.add_axes(gui.y_histogram_position, sharey=axes),
+    )
+
+    def plot_with_histograms(): #
+        host.plot_models(
+                axes, [design], labels=[directory],
+                histogram_axes=histogram_axes)
+        canvas.draw()
+
+    record('plot_models (Agg, histograms)', time_call(plot_with_histograms, repeat))
+
+    for histogram in histogram_axes:
+        figure.delaxes(histogram)
+
+    # Overlay the same design many times, like selecting hundreds of rows in
+    # the design list.
+    overlay = {'{0}:{1}'.format(directory, i): design for i in range(200)}
+    overlay_host = BenchmarkHost(overlay, filter_pane)
+
+    def plot_overlay(): #
+        overlay_host.plot_models(axes, overlay.values(), labels=overlay.keys())
+        canvas.draw()
+
+    record('plot_models (Agg, 200 designs)', time_call(plot_overlay, repeat))
+
+    return results
+
+def describe_environment():
+    root = os.path.join(os.path.dirname(__file__), '..')
+    try:
+        commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=root).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+            'commit': commit,
+            'version': show_my_designs.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': gui.pd.__version__,
+            'matplotlib': matplotlib.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare_results(old_path, new_path):
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    def key(result): #
+        return result['benchmark'], result['num_models'], result['compression']
+
+    old_results = {key(x): x for x in old['results']}
+
+    print "{0:>32s}  {1:>8s}  {2:>5s}  {3:>9s}  {4:>9s}  {5:>6s}".format(
+            'benchmark', 'models', 'fmt', 'old', 'new', 'ratio')
+
+    for result in new['results']:
+        if key(result) not in old_results:
+            continue
+        before = old_results[key(result)]['median']
+        after = result['median']
+        print "{0:>32s}  {1:>8d}  {2:>5s}  {3:8.4f}s  {4:8.4f}s  {5:6.2f}".format(
+                result['benchmark'], result['num_models'],
+                result['compression'], before, after,
+                after / before if before else float('nan'))
+
+def main():
+    import docopt
+    args = docopt.docopt(__doc__)
+
+    if args['compare']:
+        compare_results(args['<old_json>'], args['<new_json>'])
+        return
+
+    sizes = [int(x) for x in args['--sizes'].split(',')]
+    formats = args['--compression'].split(',')
+    num_atoms = int(args['--atoms'])
+    repeat = int(args['--repeat'])
+    workdir = args['--workdir'] or tempfile.mkdtemp(prefix='smd_bench_')
+    results = []
+
+    try:
+        for num_models in sizes:
+            for format in formats:
+                compress = (format == 'gzip')
+                directory = os.path.join(workdir, '{0}_{1}_{2}'.format(
+                    num_models, format, num_atoms))
+                make_synthetic_design(
+                        directory, num_models, compress, num_atoms)
+                results += run_benchmarks(
+                        directory, num_models, compress, repeat)
+    finally:
+        if not args['--workdir']:
+            shutil.rmtree(workdir)
+
+    report = {'environment': describe_environment(), 'results': results}
+
+    if args['--output']:
+        with open(args['--output'], 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print
+
+
+if __name__ == '__main__':
+    main()
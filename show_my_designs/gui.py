@@ -6,6 +6,7 @@ Judge forward-folded candidates in computational protein design pipelines.
 
 Usage:
     show_my_designs.py [options] <pdb_directories>...
+    show_my_designs.py --serve [options] [<pdb_directories>...]
     show_my_designs.py --version
 
 Options:
@@ -18,6 +19,64 @@ Options:
     -q, --quiet
         Build the cache, but don't launch the GUI.
 
+    -j, --io-threads <num>
+        How many PDB files to read at once.  Reading several files at once is
+        much faster on network file systems.  [default: 8]
+
+    -m, --memory-report
+        Print how much memory the models in each design are using.
+
+    -D, --derive <definitions>
+        Define metrics that are calculated from other metrics, as
+        semicolon-separated 'name=expression' pairs, e.g.
+        'score_gap=total_score-total_score_median'.  See the README for the
+        variables that can be used in the expressions.
+
+    -e, --export <path>
+        Write the metrics for every model that passes the filters given by
+        `--filter` to the given CSV file, rather than launching the GUI.  The
+        file is tab-separated if its name ends in '.tsv', and gzipped if its
+        name ends in '.gz'.
+
+    --filter <filters>
+        Comma-separated filters to apply when exporting models, e.g.
+        'total_score<-300,loop_rmsd<=2'.  The operators are the same as in the
+        filter pane.
+
+    -n, --no-score-files
+        Read the metrics from every PDB file, even if the directory has a score
+        file (e.g. 'score.sc') that the metrics could be read from instead.
+
+    -o, --out-of-core
+        Keep the metrics for each design in memory-mapped files rather than in
+        memory, and only plot a sample of the models in very large designs.
+        This is meant for designs with millions of models.
+
+    -P, --persistent-viewer
+        Keep one pymol or chimera process open and load models into it,
+        rather than starting a new process for every model you view.
+
+    -S, --socket <path>
+        The Unix socket used to talk to a show_my_designs server.  If a server
+        is listening on this socket, it loads the designs instead of this
+        process, which is much faster if the server has already loaded them.
+        The server isn't used if `--out-of-core`, `--no-score-files`, or
+        `--io-threads` are given, because it loads designs with its own
+        settings.  The default is '/tmp/show_my_designs.sock'.
+
+    --serve
+        Start a server that loads designs on behalf of other show_my_designs
+        processes and keeps them in memory.  Any given directories are loaded
+        right away.  The server runs until interrupted.
+
+    -p, --profile <json>
+        Record how long the slowest parts of the program take and write a
+        report to the given path on exit.
+
+    --cprofile <stats>
+        Run the whole program under cProfile and write the statistics to the
+        given path on exit.  These can be inspected with the pstats module.
+
     -v, --version
         Print the version number and exit.
 
@@ -35,29 +94,65 @@ Features:
 """
 
 ## Imports
-import collections, glob, gzip, os, re, shutil, subprocess, sys
-import gtk, gobject, pango, yaml
+import atexit, collections, contextlib, errno, functools, glob, gzip, hashlib
+import io, itertools, mmap, os, re, shutil, signal, subprocess, sys, tempfile
+import threading
+import gtk, gobject, pango, yaml, numexpr
 import matplotlib.pyplot as plt, numpy as np, scipy as sp, pandas as pd
+import matplotlib.colors, matplotlib.lines, matplotlib.patches, matplotlib.path
 
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_gtkagg import FigureCanvasGTKAgg
 from matplotlib.backends.backend_gtkagg import NavigationToolbar2GTKAgg
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mpl_toolkits.axes_grid.anchored_artists import AnchoredText
 from pprint import pprint
 
+try: from isal import isal_zlib as zlib
+except ImportError: import zlib
+
+try: from os import scandir
+except ImportError:
+    try: from scandir import scandir
+    except ImportError: scandir = None
+
+from .profiling import profiler
+
+# The umask can only be read by changing it, and files that other threads
+# create while it has been changed (e.g. caches written by the server) would
+# get the wrong permissions.  So it is read once, before any threads start.
+process_umask = os.umask(0)
+os.umask(process_umask)
+
 
 class Design (object):
 
     def __init__(self, directory, use_cache=True):
         self.directory = directory
         self.cache_path = os.path.join(directory, 'models.pkl')
+        self.mmap_path = os.path.join(directory, 'models.mmap')
+        self.silent_cache_path = os.path.join(directory, 'silent.pkl')
         self.notes_path = os.path.join(directory, 'notes.txt')
-        self.rep_path = os.path.join(directory, 'representative.txt')
+        self.rep_path = os.path.join(directory, 'representative.yml')
+        self.legacy_rep_path = os.path.join(directory, 'representative.txt')
 
         self._models = None
+        self._paths = None
+        self._silent_index = None
         self._metrics = {}
+        self._pareto_fronts = {}
+        self._plot_masks = {}
+        self._limit_masks = {}
+        self._bin_indices = {}
+        self._histograms = {}
+        self._region_masks = {}
+        self._derived_expressions = {}
+        self._derived_values = {}
+        self._funnel_scores = None
         self._notes = ""
         self._representative = None
+        self._best_model = None
+        self._file_stats = {}, {}, {}
 
         self._load_models(use_cache)
         self._load_annotations()
@@ -71,7 +166,7 @@ class Design (object):
 
     @property
     def paths(self):
-        return self._models['path']
+        return self._paths
 
     @property
     def notes(self):
@@ -84,10 +179,22 @@ class Design (object):
 
     @property
     def representative(self):
-        if self._representative is None:
-            return self.get_metric('total_score').idxmin()
-        else:
+        if self._representative is not None:
             return self._representative
+        return self.best_model
+
+    @property
+    def best_model(self):
+        """
+        The best model by the `representative_rule`, which is the
+        representative unless the user picked one.  This is only worked out
+        once.  It's saved along with any representative the user picks, but
+        looking at a design never writes anything to its directory.
+        """
+        if self._best_model is None:
+            rule = representative_rules[representative_rule]
+            self._best_model = int(rule.function(self, np.arange(len(self))))
+        return self._best_model
 
     @representative.setter
     def representative(self, index):
@@ -102,6 +209,22 @@ class Design (object):
     def metrics(self):
         return self._metrics
 
+    @property
+    def is_out_of_core(self):
+        return isinstance(self._models, MappedModels)
+
+    @property
+    def is_silent(self):
+        # Models from silent files are named after their file and their tag,
+        # see _load_silent_models().  PDB files are never in subdirectories.
+        return len(self) > 0 and '/' in self.paths[0]
+
+    @property
+    def funnel_scores(self):
+        if self._funnel_scores is None:
+            score_funnels([self])
+        return self._funnel_scores
+
     def get_metric(self, metric):
         if metric not in self.metrics:
             message = "No such metric: '{}'\n".format(metric)
@@ -111,72 +234,629 @@ class Design (object):
 
             raise RuntimeError(message)
 
+        if metric in self._derived_expressions:
+            return self._get_derived_metric(metric)
+
         return self._models[metric]
 
+    def apply_filters(self, filters):
+        """
+        Return a boolean mask of the models that pass every given (name,
+        operator, threshold) filter, and the number of models that pass each
+        filter on its own.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        num_passing = []
+
+        for name, operator, threshold in filters:
+            result = apply_filter(self.get_metric(name), operator, threshold)
+            num_passing.append(np.count_nonzero(result))
+            keep &= result
+
+        return keep, num_passing
+
+    def get_model_path(self, index):
+        """
+        Return the path to a PDB file for the given model.  Models from silent
+        files are written to a temporary PDB file first, see SilentIndex.
+        """
+        if self._silent_index is not None:
+            return self._silent_index.extract_pdb(self.directory, index)
+        return os.path.join(self.directory, self.paths[index])
+
+    def get_model_locations(self, indices):
+        """
+        Return the path to the file holding each given model, and the tag of
+        each model within its file.  Only models from silent files have tags,
+        the tags of models from PDB files are None.  Unlike get_model_path(),
+        this never extracts models from silent files.
+        """
+        names = self.paths.take(indices)
+
+        if not self.is_silent:
+            paths = [os.path.join(self.directory, x) for x in names]
+            return paths, [None] * len(paths)
+
+        paths, tags = [], []
+        for name in names:
+            file, _, tag = name.partition('/')
+            paths.append(os.path.join(self.directory, file))
+            tags.append(tag)
+        return paths, tags
+
+    def refresh(self, use_cache=True):
+        """
+        Load any models that have been added to (or changed in) the directory
+        since the design was loaded.  A representative picked by the user is
+        kept, as long as its model still exists.  If the representative rule
+        is incremental, only the new and changed models are compared to the
+        old best model rather than searching every model again.
+        """
+        old_pdb_stats, old_score_stats, old_silent_stats = self._file_stats
+        rep_path = self.paths[self._representative] \
+                if self._representative is not None else None
+        best_path = self.paths[self._best_model] \
+                if self._best_model is not None else None
+
+        self._load_models(use_cache)
+
+        self._representative = self.paths.find(rep_path) \
+                if rep_path is not None else None
+        self._best_model = None
+
+        # A changed score or silent file can change any model, and if the old
+        # best model changed, any other model could now be better.  Either way
+        # the best model has to be found from scratch.
+
+        pdb_stats, score_stats, silent_stats = self._file_stats
+        changed_names = [
+                name for name, stat in pdb_stats.items()
+                if old_pdb_stats.get(name) != stat]
+
+        rule = representative_rules[representative_rule]
+        previous = self.paths.find(best_path) \
+                if best_path is not None else None
+
+        if rule.incremental and previous is not None \
+                and score_stats == old_score_stats \
+                and silent_stats == old_silent_stats \
+                and best_path not in changed_names:
+            paths = np.array(self.paths.take(slice(None)))
+            candidates = np.flatnonzero(np.in1d(paths, changed_names))
+            candidates = np.append(previous, candidates)
+            self._best_model = int(rule.function(self, candidates))
+
     def get_coord(self, x_metric, y_metric, index=None):
         i = index if index is not None else self.representative
         return self.get_metric(x_metric)[i], self.get_metric(y_metric)[i]
 
+    def get_pareto_front(self, x_metric, y_metric):
+        """
+        Return a boolean mask of the models that are on the Pareto front of
+        the given metrics, i.e. that are not beaten on both metrics by any
+        other model.  Whether higher or lower values are better is determined
+        by the `direction` of each metric.  The front is cached for each pair
+        of metrics.
+        """
+        key = x_metric, y_metric
+
+        if key not in self._pareto_fronts:
+            def get_badness(metric): #
+                values = self.get_metric(metric).values.astype(np.float64)
+                if self.metrics[metric].direction == 'higher':
+                    values = -values
+                return values
+
+            self._pareto_fronts[key] = find_pareto_front(
+                    get_badness(x_metric), get_badness(y_metric))
+
+        return self._pareto_fronts[key]
+
+    def get_plot_mask(self, x_metric, y_metric, max_points=None):
+        """
+        Return a boolean mask of the models that should be plotted.  This is
+        every model, unless the design has more than `max_points` models, in
+        which case they are thinned out by downsample_models().  Designs that
+        were loaded out-of-core are always thinned to `max_plotted_points`.
+        The masks are cached for each pair of metrics.
+        """
+        if max_points is None and self.is_out_of_core:
+            max_points = max_plotted_points
+
+        if max_points is None or len(self) <= max_points:
+            key = None
+        else:
+            key = x_metric, y_metric, max_points, self.representative
+
+        if key not in self._plot_masks:
+            if key is None:
+                mask = np.ones(len(self), dtype=bool)
+            else:
+                mask = downsample_models(self, x_metric, y_metric, max_points)
+            self._plot_masks[key] = mask
+
+        return self._plot_masks[key]
+
+    def get_limit_values(self, metric):
+        """
+        Return the values of the given metric that the axis limits should be
+        based on.  For designs loaded out-of-core, this is an even sample of
+        the models along with the models with the most extreme values.
+        """
+        values = self.get_metric(metric)
+
+        if self.is_out_of_core and len(self) > max_plotted_points:
+            if metric not in self._limit_masks:
+                step = int(np.ceil(len(self) / float(max_plotted_points)))
+                mask = np.zeros(len(self), dtype=bool)
+                mask[::step] = True
+                mask[find_extremes(values.values, num_extreme_points)] = True
+                self._limit_masks[metric] = mask
+
+            values = values[self._limit_masks[metric]]
+
+        return values
+
+    def get_region_mask(self, x_metric, y_metric, vertices):
+        """
+        Return a boolean mask of the models that fall inside the polygon with
+        the given vertices, in the space of the given metrics.  Only the models
+        inside the bounding box of the polygon are tested, all at once, by
+        matplotlib.  The mask is cached for each region.
+        """
+        vertices = tuple(tuple(x) for x in vertices)
+        key = x_metric, y_metric, vertices
+
+        if key not in self._region_masks:
+            x = np.asarray(self.get_metric(x_metric), dtype=float)
+            y = np.asarray(self.get_metric(y_metric), dtype=float)
+            (x_min, y_min), (x_max, y_max) = \
+                    np.min(vertices, axis=0), np.max(vertices, axis=0)
+
+            mask = (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+            candidates = np.flatnonzero(mask)
+            mask[candidates] = matplotlib.path.Path(vertices).contains_points(
+                    np.column_stack([x[candidates], y[candidates]]))
+
+            self._region_masks[key] = mask
+
+        return self._region_masks[key]
+
+    def get_histogram(self, metric, bins, mask=None):
+        """
+        Return how many models fall into each of the given bins, counting only
+        the models in the given mask (if any).  Which bin each model falls into
+        is cached for each metric, so histograms for new masks (e.g. when the
+        filters change) only have to be counted.  Values outside the bins
+        aren't counted.
+        """
+        key = metric, bins[0], bins[-1], len(bins)
+
+        if key not in self._bin_indices:
+            values = np.asarray(self.get_metric(metric), dtype=float)
+            self._bin_indices[key] = np.searchsorted(
+                    bins, values, side='right').astype(
+                            np.min_scalar_type(len(bins)))
+
+        if mask is None and key in self._histograms:
+            return self._histograms[key]
+
+        indices = self._bin_indices[key]
+        if mask is not None:
+            indices = indices[mask]
+
+        counts = np.bincount(indices, minlength=len(bins) + 1)[1:len(bins)]
+
+        if mask is None:
+            self._histograms[key] = counts
+
+        return counts
+
+    def get_memory_usage(self):
+        """
+        Return the number of bytes used to store each column of model data.
+        """
+        usage = self._models.memory_usage(index=False, deep=True)
+        usage['path'] = self._paths.nbytes
+        return usage
+
+    def get_memory_report(self):
+        usage = self.get_memory_usage()
+        lines = ["{}: {} models, {}".format(
+            self.directory, len(self), format_bytes(usage.sum()))]
+
+        for column in sorted(usage.index):
+            dtype = self._models[column].dtype if column in self._models \
+                    else self._paths.dtype
+            lines.append("    {:<24s} {:>10s}  {}".format(
+                column, format_bytes(usage[column]), dtype))
+
+        return '\n'.join(lines)
+
 
+    @profiler.timed('Design._load_models')
     def _load_models(self, use_cache):
         """
         Load a variety of score and distance metrics for the structures found
         in the given directory.  As much information as possible will be
         cached.  Note that new information will only be calculated for file
-        names that haven't been seen before.  If a file changes or is deleted,
-        the cache will not be updated to reflect this and you may be presented
-        with stale data.
+        names that haven't been seen before, or for files whose size or
+        modification time has changed since they were cached.  If a file is
+        deleted, the cache will not be updated to reflect this and you may be
+        presented with stale data.
         """
 
         # Make sure the given directory matches all of our expectations: i.e.
-        # that it exists and contains PDB files.
+        # that it exists and contains PDB files.  The directory is only listed
+        # once, because listing directories is slow on network file systems.
 
         if not os.path.exists(self.directory):
             raise IOError("'{}' does not exist".format(self.directory))
         if not os.path.isdir(self.directory):
             raise IOError("'{}' is not a directory".format(self.directory))
-        if not os.listdir(self.directory):
+
+        with profiler.section('Design._load_models: glob'):
+            pdb_stats, num_entries, score_stats, silent_stats = \
+                    scan_pdb_directory(self.directory)
+
+        self._file_stats = pdb_stats, score_stats, silent_stats
+
+        if not num_entries:
             raise IOError("'{}' is empty".format(self.directory))
-        if not glob.glob(os.path.join(self.directory, '*.pdb*')):
-            raise IOError("'{}' doesn't contain any PDB files".format(self.directory))
 
-        # Find all the structures in the given directory, then decide which
-        # have already been cached and which haven't.
+        # Designs without any PDB files can be stored in rosetta silent files
+        # instead, see _load_silent_models().
+
+        if not pdb_stats:
+            silent_stats = collections.OrderedDict(
+                    (name, stat) for name, stat in silent_stats.items()
+                    if is_silent_file(os.path.join(self.directory, name)))
+
+            if not silent_stats:
+                raise IOError("'{}' doesn't contain any PDB or silent files".format(self.directory))
+
+            self._load_silent_models(silent_stats, use_cache)
+            self._load_metrics()
+            return
+
+        # Designs that are loaded out-of-core have a separate cache, see
+        # _load_mapped_models().
+
+        if out_of_core:
+            self._load_mapped_models(pdb_stats, use_cache)
+            self._load_metrics()
+            return
+
+        # If the directory has a score file (e.g. rosetta's score.sc), read the
+        # metrics from it rather than opening every model.
+
+        if use_score_files and score_stats:
+            if self._load_scored_models(pdb_stats, score_stats):
+                self._load_metrics()
+                return
+
+        # Decide which structures have already been cached and which haven't.
+        # Structures that have changed since they were cached are parsed again.
+
+        # A cache that can't be read (e.g. because it was truncated) is
+        # ignored, so only this design has to be parsed again.
 
-        pdb_paths = glob.glob(os.path.join(self.directory, '*.pdb*'))
-        base_pdb_names = set(os.path.basename(x) for x in pdb_paths)
+        cache = None
 
         if use_cache and os.path.exists(self.cache_path):
-            cached_records = pd.read_pickle(self.cache_path).to_dict('records')
-            cached_paths = set(
-                    record['path'] for record in cached_records
-                    if 'path' in record)
-            uncached_paths = [
-                    pdb_path for pdb_path in pdb_paths
-                    if os.path.basename(pdb_path) not in cached_paths]
+            try:
+                with profiler.section('Design._load_models: read cache'):
+                    cache = load_cache(self.cache_path)
+            except Exception as error:
+                print "Warning: ignoring corrupt cache '{}' ({})".format(
+                        self.cache_path, error)
+
+        if cache is not None:
+            cached_columns, cached_paths, cached_stats = cache
+            cached_stats = dict(zip(cached_paths, cached_stats))
+            stale_names = set(
+                    name for name, stat in pdb_stats.items()
+                    if name not in cached_stats
+                    or cached_stats[name] not in (None, stat))
         else:
-            cached_records = []
-            uncached_paths = pdb_paths
+            cached_columns, cached_paths, cached_stats = {}, [], {}
+            stale_names = set(pdb_stats)
+
+        uncached_paths = [
+                os.path.join(self.directory, name)
+                for name in pdb_stats if name in stale_names]
+
+        # Each extractor's columns are cached separately.  Extractors that are
+        # new, or whose version has changed, are run on every model.  The rest
+        # are only run on the models that weren't cached.  Either way, each
+        # file is only read once.
+
+        extractors = get_enabled_extractors()
+        outdated = [
+                x for x in extractors
+                if cached_columns.get(x.name, (None, None))[0] != x.version]
+        rescanned_paths = [
+                os.path.join(self.directory, name)
+                for name in cached_paths if name not in stale_names] \
+                        if outdated else []
+
+        uncached_records = extract_records(uncached_paths, extractors)
+        rescanned_records = extract_records(rescanned_paths, outdated)
+
+        # Combine the cached and uncached columns of each extractor into a
+        # single data frame.  The paths are kept separately, because they take
+        # up much less memory that way.  Models that were parsed again replace
+        # their old rows, so the indices of the other models don't change.
+
+        uncached_names = next(iter(uncached_records.values()), pd.DataFrame())
+        uncached_names = uncached_names['path'] \
+                if 'path' in uncached_names else []
+
+        names = list(cached_paths) + list(uncached_names)
+        order = range(len(cached_paths))
+        positions = {name: i for i, name in enumerate(cached_paths)}
+
+        for i, name in enumerate(uncached_names, len(cached_paths)):
+            if name in positions:
+                order[positions[name]] = i
+            else:
+                order.append(i)
+
+        columns = collections.OrderedDict()
+        cached_names = list(cached_paths)
+
+        for extractor in extractors:
+            uncached = uncached_records[extractor.name].drop(
+                    'path', axis=1, errors='ignore')
 
-        # Calculate score and distance metrics for the uncached paths, then
-        # combine the cached and uncached data into a single data frame.
+            if extractor in outdated:
+                cached = rescanned_records[extractor.name]
+                cached = cached.set_index('path').reindex(cached_names) \
+                        if 'path' in cached else pd.DataFrame(index=cached_names)
+            else:
+                cached = cached_columns[extractor.name][1]
+
+            parts = [x.reset_index(drop=True) for x in (cached, uncached) if len(x)]
+            columns[extractor.name] = compact_models(pd.concat(
+                    parts, ignore_index=True).iloc[order].reset_index(drop=True)
+                    if parts else pd.DataFrame())
 
-        uncached_records = parse_records_from_pdbs(uncached_paths)
-        self._models = pd.DataFrame(cached_records + uncached_records)
+        self._paths = ModelPaths(names[i] for i in order)
+        self._models = merge_extractor_columns(columns.values()) \
+                if len(self._paths) else pd.DataFrame()
 
         # Derive information on the metrics that can be plotted from the 
 
         self._load_metrics()
 
         # If everything else looks good, cache the data frame so we can load
-        # faster next time.
+        # faster next time.  Don't bother if nothing has changed, unless the
+        # cache is from an old version that didn't record file stats.  The
+        # columns of extractors that aren't enabled anymore are dropped.
+
+        is_cache_stale = bool(uncached_paths) or bool(outdated) or \
+                any(x is None for x in cached_stats.values())
+
+        if not self._models.empty and is_cache_stale:
+            stats = [
+                    pdb_stats.get(name) or cached_stats.get(name) or (0, 0)
+                    for name in self._paths]
+            columns = collections.OrderedDict(
+                    (x.name, (x.version, columns[x.name])) for x in extractors)
+            with profiler.section('Design._load_models: write cache'):
+                save_cache(self.cache_path, columns, self._paths, stats)
+
+    def _load_silent_models(self, silent_stats, use_cache):
+        """
+        Load the models in this design from rosetta silent files.  Each file
+        is scanned once to find where each model starts and ends, and the
+        metrics are parsed from the SCORE lines alone.  The offsets and the
+        metrics are cached together, and are rebuilt if any silent file has
+        changed.  Each model is named after its silent file and its tag, e.g.
+        'default.out/model_0001'.
+        """
+        files = list(silent_stats)
+        stats = [silent_stats[x] for x in files]
+
+        if use_cache and os.path.exists(self.silent_cache_path):
+            try:
+                with profiler.section('Design._load_models: read cache'):
+                    cache = read_cache(self.silent_cache_path)
+
+                if cache is not None and \
+                        cache['files'] == files and cache['stats'] == stats:
+                    self._silent_index = cache['index']
+                    self._paths = cache['paths']
+                    self._models = add_fallback_columns(cache['models'])
+                    return
+
+            except Exception as error:
+                print "Warning: ignoring corrupt cache '{}' ({})".format(
+                        self.silent_cache_path, error)
+
+        headers, file_indices, offsets, lengths = [], [], [], []
+        names, tables = [], []
+
+        for i, file in enumerate(files):
+            path = os.path.join(self.directory, file)
+            with profiler.section('Design._load_models: index silent file'):
+                header, score_header, score_lines, starts, ends = \
+                        index_silent_file(path)
+
+            tags = [x.split()[-1] for x in score_lines]
+            table = parse_score_table(io.BytesIO(
+                    score_header + '\n' + '\n'.join(score_lines)), path)
+
+            headers.append(header)
+            file_indices += [i] * len(tags)
+            offsets += starts
+            lengths += [end - start for start, end in zip(starts, ends)]
+            names += ['{}/{}'.format(file, tag) for tag in tags]
+            tables.append(table.reindex(
+                    [strip_pdb_extension(x) for x in tags]))
+
+        if not names:
+            raise IOError("'{}' doesn't contain any models".format(self.directory))
+
+        self._silent_index = SilentIndex(
+                files, headers, file_indices, offsets, lengths)
+        self._paths = ModelPaths(names)
+        self._models = compact_models(
+                pd.concat(tables, sort=False, ignore_index=True))
+
+        cache = {
+                'files': files,
+                'stats': stats,
+                'index': self._silent_index,
+                'paths': self._paths,
+                'models': self._models,
+        }
+        with cache_lock(self.silent_cache_path) as is_locked:
+            if is_locked:
+                replace_atomically(
+                        self.silent_cache_path, lambda x: pd.to_pickle(cache, x))
+
+    def _load_scored_models(self, pdb_stats, score_stats):
+        """
+        Read the metrics for each model from the score files in this design
+        (e.g. rosetta's score.sc) instead of opening every model.  Models that
+        aren't in any score file (e.g. because it's still being written) are
+        parsed from their PDB files, without being cached.  Return False if
+        none of the models are in the score files, in which case nothing is
+        loaded.
+        """
+        with profiler.section('Design._load_models: read score files'):
+            scores = pd.concat([
+                    read_score_file(os.path.join(self.directory, x))
+                    for x in score_stats], sort=False)
+            scores = scores[~scores.index.duplicated(keep='last')]
+
+        names = list(pdb_stats)
+        keys = pd.Index([strip_pdb_extension(x) for x in names])
+        is_scored = keys.isin(scores.index)
+
+        if not is_scored.any():
+            return False
+
+        models = scores.reindex(keys)
+        models.index = range(len(names))
+
+        if not is_scored.all():
+            unscored_paths = [
+                    os.path.join(self.directory, name)
+                    for name, x in zip(names, is_scored) if not x]
+            records = merge_extractor_columns(extract_records(
+                    unscored_paths, get_enabled_extractors()).values())
+
+            if 'path' in records:
+                positions = {name: i for i, name in enumerate(names)}
+                records.index = records.pop('path').map(positions)
+                models = models.combine_first(records)
+
+        self._paths = ModelPaths(names)
+        self._models = compact_models(models)
+        return True
+
+    def _load_mapped_models(self, pdb_stats, use_cache):
+        """
+        Load the metrics for every model into memory-mapped column files, so
+        that designs with millions of models don't need to fit in memory.  The
+        models are parsed in chunks, so they never all have to be in memory at
+        once either.  Unlike the regular cache, this one isn't updated
+        incrementally: it's rebuilt from scratch if any model has changed.
+        """
+        names = list(pdb_stats)
+        stats = np.array(pdb_stats.values(), dtype=np.float64)
+        versions = {x.name: x.version for x in get_enabled_extractors()}
+        index_path = os.path.join(self.mmap_path, 'index.pkl')
 
-        if not self._models.empty:
-            self._models.to_pickle(self.cache_path)
+        if use_cache and os.path.exists(index_path):
+            try:
+                with profiler.section('Design._load_models: read cache'):
+                    index = read_cache(index_path)
+
+                if index is not None and \
+                        np.array_equal(index['stats'], stats) and \
+                        list(index['paths']) == names and \
+                        index.get('extractors', {'scores': 1}) == versions:
+                    self._paths = index['paths']
+                    self._models = MappedModels(self.mmap_path, index['columns'])
+                    return
+
+            except Exception as error:
+                print "Warning: ignoring corrupt cache '{}' ({})".format(
+                        self.mmap_path, error)
+
+        # Build the new cache in a temporary directory, then move it into
+        # place.  That way other processes never see a half-written cache.
+
+        build_path = tempfile.mkdtemp(
+                dir=self.directory, prefix='.models.mmap.')
+        os.chmod(build_path, 0o777 & ~get_umask())
+
+        # The columns are decided by the first chunk.  Models that couldn't be
+        # read, or that are missing a metric, get NaN for that metric.
+
+        columns, files = None, {}
+
+        for start in range(0, len(names), out_of_core_chunk_size):
+            chunk = names[start:start + out_of_core_chunk_size]
+            records = pd.DataFrame(parse_records_from_pdbs([
+                os.path.join(self.directory, x) for x in chunk]))
+            records = records.set_index('path').reindex(chunk) \
+                    if 'path' in records else pd.DataFrame(index=chunk)
+
+            if columns is None:
+                columns = [
+                        x for x in records
+                        if records[x].dtype.kind in 'biuf']
+                files = {
+                        x: np.lib.format.open_memmap(
+                            os.path.join(build_path, x + '.npy'),
+                            mode='w+', dtype=np.float64, shape=(len(names),))
+                        for x in columns}
+
+            for column in columns:
+                files[column][start:start + len(chunk)] = records[column].values \
+                        if column in records else np.nan
+
+        for file in files.values():
+            file.flush()
+
+        self._paths = ModelPaths(names)
+        pd.to_pickle(
+                {'columns': columns, 'paths': self._paths, 'stats': stats,
+                 'extractors': versions},
+                os.path.join(build_path, 'index.pkl'))
+
+        # If another process is already replacing the cache, use the files
+        # that were just written without keeping them.  They stay mapped
+        # after being deleted.
+
+        with cache_lock(self.mmap_path) as is_locked:
+            if is_locked:
+                old_path = build_path + '.old'
+                if os.path.exists(self.mmap_path):
+                    os.rename(self.mmap_path, old_path)
+                os.rename(build_path, self.mmap_path)
+                shutil.rmtree(old_path, ignore_errors=True)
+                self._models = MappedModels(self.mmap_path, columns)
+            else:
+                self._models = MappedModels(build_path, columns)
+                shutil.rmtree(build_path)
 
     def _load_metrics(self):
+        self._pareto_fronts = {}
+        self._plot_masks = {}
+        self._limit_masks = {}
+        self._bin_indices = {}
+        self._histograms = {}
+        self._region_masks = {}
+        self._derived_values = {}
+        self._funnel_scores = None
+
         # Treat column in self._models that contains numeric data as a metric.
-        # Any dtype other than 'object' is assumed to be numeric.
+        # Any boolean, integer, or floating point column is numeric.
 
         self._metrics = {
             x: MetricInfo(
@@ -185,11 +865,32 @@ class Design (object):
                 order=get_metric_order(x, self),
                 guide=get_metric_guide(x, self),
                 limits=get_metric_limits(x, self),
+                direction=get_metric_direction(x, self),
             )
             for x in self._models.keys()
-            if self._models[x].dtype != 'object'
+            if self._models.dtypes[x].kind in 'biuf'
         }
 
+        # Add the derived metrics that can be calculated from the metrics this
+        # design has.  They aren't calculated until they're used.  Derived
+        # metrics can use the ones defined before them.
+
+        self._derived_expressions = {}
+
+        for metric in derived_metrics.values():
+            if not all(self._has_variable(x) for x in metric.variables):
+                continue
+
+            self._derived_expressions[metric.name] = metric.expression
+            self._metrics[metric.name] = MetricInfo(
+                    metric.name,
+                    title=get_metric_title(metric.name, self),
+                    order=get_metric_order(metric.name, self),
+                    guide=get_metric_guide(metric.name, self),
+                    limits=get_metric_limits(metric.name, self),
+                    direction=get_metric_direction(metric.name, self),
+            )
+
         # Make sure at least two metrics have been associated with each model
         # in this directory.
 
@@ -199,6 +900,40 @@ class Design (object):
             name = next(iter(self._metrics))
             raise IOError("only found one metric '{}' for the models in '{}', need at least two".format(name, self.directory))
 
+    def _has_variable(self, name):
+        if name in self._metrics:
+            return True
+        metric, _, statistic = name.rpartition('_')
+        return statistic in derived_metric_statistics and metric in self._metrics
+
+    def _get_variable(self, name):
+        """
+        Return the values of the given metric, or the given statistic of a
+        metric (e.g. 'total_score_median') over the whole design.
+        """
+        if name in self._metrics:
+            return np.asarray(self.get_metric(name))
+
+        if name not in self._derived_values:
+            metric, _, statistic = name.rpartition('_')
+            values = np.asarray(self.get_metric(metric), dtype=float)
+            self._derived_values[name] = \
+                    derived_metric_statistics[statistic](values)
+
+        return self._derived_values[name]
+
+    def _get_derived_metric(self, metric):
+        if metric not in self._derived_values:
+            variables = {
+                    x: self._get_variable(x)
+                    for x in derived_metrics[metric].variables}
+            values = numexpr.evaluate(
+                    self._derived_expressions[metric], local_dict=variables)
+            self._derived_values[metric] = pd.Series(
+                    np.broadcast_to(values, len(self)).copy())
+
+        return self._derived_values[metric]
+
     def _load_annotations(self):
         try:
             with open(self.notes_path) as file:
@@ -206,11 +941,44 @@ class Design (object):
         except IOError:
             pass
 
+        # The representative is saved by path, so it still refers to the same
+        # model after models are added to the design.  Older versions saved
+        # the index of the representative in 'representative.txt'.
+
         try:
             with open(self.rep_path) as file:
-                self._representative = int(file.read())
+                saved = yaml.safe_load(file) or {}
         except IOError:
-            pass
+            saved = {}
+            try:
+                with open(self.legacy_rep_path) as file:
+                    self._representative = int(file.read())
+            except IOError:
+                pass
+
+        if saved.get('path') is not None:
+            self._representative = self.paths.find(saved['path'])
+
+        # The best model is only reused if it was found by the same rule for
+        # exactly the same files, i.e. no model has been added, removed, or
+        # rewritten since.
+
+        if saved.get('best_path') is not None \
+                and saved.get('rule') == representative_rule \
+                and saved.get('signature') is not None \
+                and saved.get('signature') == self._get_file_signature():
+            self._best_model = self.paths.find(saved['best_path'])
+
+    def _get_file_signature(self):
+        """
+        Return a digest of the names, sizes, and modification times of the
+        files the models were loaded from, or None if they aren't known (e.g.
+        because a server loaded the models).
+        """
+        if not any(self._file_stats):
+            return None
+        stats = [sorted(x.items()) for x in self._file_stats]
+        return hashlib.md5(repr(stats)).hexdigest()
 
     def _save_notes(self):
         with open(self.notes_path, 'w') as file:
@@ -220,17 +988,33 @@ class Design (object):
             os.remove(self.notes_path)
 
     def _save_representative(self):
+        saved = {}
+
         if self._representative is not None:
-            with open(self.rep_path, 'w') as file:
-                file.write(str(self._representative))
+            saved['path'] = self.paths[self._representative]
 
+        if self._best_model is not None \
+                and self._get_file_signature() is not None:
+            saved['rule'] = representative_rule
+            saved['best_path'] = self.paths[self._best_model]
+            saved['signature'] = self._get_file_signature()
+
+        def write(path): #
+            with open(path, 'w') as file:
+                yaml.safe_dump(saved, file, default_flow_style=False)
+
+        if saved:
+            replace_atomically(self.rep_path, write)
         elif os.path.exists(self.rep_path):
             os.remove(self.rep_path)
 
+        if os.path.exists(self.legacy_rep_path):
+            os.remove(self.legacy_rep_path)
+
 
 class ShowMyDesigns (gtk.Window):
 
-    def __init__(self, designs):
+    def __init__(self, designs, persistent_viewer=False):
 
         # Setup the parent class.
 
@@ -245,9 +1029,27 @@ class ShowMyDesigns (gtk.Window):
         self.designs = designs
         self.keys = list()
         self.selected_model = None
+        self.clicked_model = None
+        self.model_menus = {}
+        self.design_rows = {}
+        self.metric_limits = {}
+        self.histogram_bins = {}
+        self.selected_region = None
+        self.regions = collections.OrderedDict()
+        self.lasso = None
+        self.prerendered_plots = {}
+        self.is_plot_dirty = False
+        self.num_redraws = 0
+        self.viewer_sessions = {
+                name: ViewerSession(name, **viewer_commands[name])
+                for name in viewer_commands
+        } if persistent_viewer else None
         self.is_legend_visible = False
         self.is_representative_visible = False
         self.is_model_count_visible = False
+        self.is_pareto_front_visible = False
+        self.is_downsampling_enabled = False
+        self.is_histograms_visible = False
 
         self.metrics = {
                 k: next(iter(self)).metrics[k]
@@ -265,6 +1067,16 @@ class ShowMyDesigns (gtk.Window):
                 default_y_metric
                 if default_y_metric in self.metrics
                 else self.sorted_metrics[1])
+        self.filter_metrics = {
+                'pareto_front': MetricInfo(
+                    'pareto_front',
+                    title='Pareto Front (Current Axes)',
+                    order=None,
+                    guide=None,
+                    limits=lambda x: (0, 1),
+                    direction='higher',
+                ),
+        }
 
         # Setup the GUI.
 
@@ -314,6 +1126,32 @@ class ShowMyDesigns (gtk.Window):
         item.connect('activate', lambda _: self.save_selected_funnels())
         menu.append(item)
 
+        item = gtk.MenuItem("Export filtered models")
+        item.connect('activate', lambda _: self.export_filtered_models())
+        menu.append(item)
+
+        # The "Selection" menu:
+        menu = gtk.Menu()
+        item = gtk.MenuItem("_Selection")
+        item.set_submenu(menu)
+        bar.append(item)
+
+        item = gtk.MenuItem("Lasso a region")
+        item.connect('activate', lambda _: self.lasso_mode())
+        menu.append(item)
+
+        item = gtk.MenuItem("Save region as filter")
+        item.connect('activate', lambda _: self.save_region_as_filter())
+        menu.append(item)
+
+        item = gtk.MenuItem("Save paths in region")
+        item.connect('activate', lambda _: self.save_region_paths())
+        menu.append(item)
+
+        item = gtk.MenuItem("Clear region")
+        item.connect('activate', lambda _: self.clear_region())
+        menu.append(item)
+
         # The "View" menu:
         menu = gtk.Menu()
         item = gtk.MenuItem("_View")
@@ -347,6 +1185,18 @@ class ShowMyDesigns (gtk.Window):
         item.connect('activate', self.on_toggle_model_count)
         menu.append(item)
 
+        item = self.pareto_front_toggle = gtk.CheckMenuItem("Pareto front")
+        item.connect('activate', self.on_toggle_pareto_front)
+        menu.append(item)
+
+        item = self.histograms_toggle = gtk.CheckMenuItem("Marginal histograms")
+        item.connect('activate', self.on_toggle_histograms)
+        menu.append(item)
+
+        item = self.downsampling_toggle = gtk.CheckMenuItem("Downsample large designs")
+        item.connect('activate', self.on_toggle_downsampling)
+        menu.append(item)
+
         return bar
 
     def setup_model_viewer(self):
@@ -370,7 +1220,11 @@ class ShowMyDesigns (gtk.Window):
         return viewer
 
     def setup_model_list(self):
-        list_store = gtk.ListStore(str)
+        # The first column holds the key of each design.  The rest hold values
+        # that are computed once per design (see get_design_row()), so that
+        # GTK can sort the list natively without calling back into python.
+
+        list_store = gtk.ListStore(str, *[x[1] for x in design_list_columns])
 
         text = gtk.CellRendererText()
         icon = gtk.CellRendererPixbuf()
@@ -381,35 +1235,23 @@ class ShowMyDesigns (gtk.Window):
         self.view.set_enable_search(False)
         self.view.set_headers_visible(False)
 
-        columns = [
-                ('Name', 'directory'),
-        ]
-
-        for index, parameters in enumerate(columns):
-            title, attr = parameters
+        for index, parameters in enumerate(design_list_columns, 1):
+            title, type, getter, direction = parameters
 
-            def cell_data_func(column, cell, model, iter, attr): #
-                key = model.get_value(iter, 0)
-                design = self.designs[key]
-                text = getattr(design, attr)
+            def cell_data_func(column, cell, model, iter, index): #
+                text = format_value(model.get_value(iter, index))
                 cell.set_property('text', text)
 
-            def sort_func(model, iter_1, iter_2, attr): #
-                key_1 = model.get_value(iter_1, 0)
-                key_2 = model.get_value(iter_2, 0)
-                design_1 = self.designs[key_1]
-                design_2 = self.designs[key_2]
-                value_1 = getattr(design_1, attr)
-                value_2 = getattr(design_2, attr)
-                return cmp(value_1, value_2)
-
-            list_store.set_sort_func(index, sort_func, attr);
-
             column = gtk.TreeViewColumn(title, text)
-            column.set_cell_data_func(text, cell_data_func, attr)
+            if type is float:
+                column.set_cell_data_func(text, cell_data_func, index)
+            else:
+                column.add_attribute(text, 'text', index)
             column.set_sort_column_id(index)
             self.view.append_column(column)
 
+        self.view.set_headers_visible(len(design_list_columns) > 1)
+
         selector = self.view.get_selection()
         selector.connect("changed", self.on_select_designs)
         selector.set_mode(gtk.SELECTION_MULTIPLE)
@@ -439,9 +1281,20 @@ class ShowMyDesigns (gtk.Window):
 
         # Create the axes.
 
-        self.axes = figure.add_axes((0.15, 0.15, 0.75, 0.75))
+        self.axes = figure.add_axes(plot_position)
         self.axes.set_ylabel('Score')
 
+        # Create the marginal histograms, which share an axis with the plot so
+        # that they follow it when it's panned or zoomed.  They're hidden
+        # until the user asks for them.
+
+        self.histogram_axes = (
+                figure.add_axes(x_histogram_position, sharex=self.axes),
+                figure.add_axes(y_histogram_position, sharey=self.axes),
+        )
+        for axes in self.histogram_axes:
+            axes.set_visible(False)
+
         # Create the canvas.
 
         self.canvas = FigureCanvas(figure)
@@ -494,22 +1347,34 @@ class ShowMyDesigns (gtk.Window):
 
         return frame
 
-    def setup_metric_menu(self, callback=None, initial_choice=None):
-        try: self.metric_store
+    def setup_metric_menu(self, callback=None, initial_choice=None,
+            filterable=False):
+        # Menus used to pick filters also offer metrics that only make sense
+        # as filters, like whether or not each model is on the Pareto front.
+
+        sorted_metrics = self.sorted_metrics
+        if filterable:
+            sorted_metrics = sorted_metrics + sorted(self.filter_metrics)
+
+        try: self.metric_stores
         except AttributeError:
-            self.metric_store = gtk.ListStore(str, str)
+            self.metric_stores = {}
+
+        if filterable not in self.metric_stores:
+            metric_store = self.metric_stores[filterable] = \
+                    gtk.ListStore(str, str)
 
-            for key in self.sorted_metrics:
-                metric = self.metrics[key]
-                self.metric_store.append([metric.name, metric.title])
+            for key in sorted_metrics:
+                metric = self.metrics.get(key) or self.filter_metrics[key]
+                metric_store.append([metric.name, metric.title])
 
         cell = gtk.CellRendererText()
-        menu = gtk.ComboBox(self.metric_store)
+        menu = gtk.ComboBox(self.metric_stores[filterable])
         menu.pack_start(cell, True)
         menu.add_attribute(cell, 'text', 1)
 
         menu.set_active(0)
-        for i, metric in enumerate(self.sorted_metrics):
+        for i, metric in enumerate(sorted_metrics):
             if metric == initial_choice:
                 menu.set_active(i)
 
@@ -519,6 +1384,42 @@ class ShowMyDesigns (gtk.Window):
         return menu
 
 
+    def setup_model_menu(self, sho_scripts):
+        menu = gtk.Menu()
+
+        for script in sho_scripts:
+            title = os.path.basename(os.path.splitext(script)[0])
+            title = title[0].upper() + title[1:]
+            title = title.replace('_', ' ')
+
+            item = gtk.MenuItem(title)
+            item.connect('activate', self.on_run_script, script)
+            menu.append(item)
+
+        for program in ('pymol', 'chimera'):
+            item = gtk.MenuItem("View model in {}".format(program))
+            item.connect('activate', self.on_view_model, program)
+            menu.append(item)
+
+            if self.viewer_sessions and program in self.viewer_sessions:
+                item = gtk.MenuItem("Add model to {}".format(program))
+                item.connect('activate', self.on_view_model, program, False)
+                menu.append(item)
+
+        menu.append(gtk.SeparatorMenuItem())
+
+        copy_path = gtk.MenuItem("Copy path to model")
+        copy_path.connect('activate', self.on_copy_model_path)
+        menu.append(copy_path)
+
+        choose_rep = gtk.MenuItem("Set as representative")
+        choose_rep.connect('activate', self.on_set_representative)
+        menu.append(choose_rep)
+
+        menu.foreach(lambda item: item.show())
+        return menu, choose_rep
+
+
     def on_hotkey_press(self, widget, event):
         key = gtk.gdk.keyval_name(event.keyval).lower()
         if event.state & gtk.gdk.CONTROL_MASK: key = 'ctrl-' + key
@@ -531,6 +1432,7 @@ class ShowMyDesigns (gtk.Window):
                 'i': self.insert_mode,     'a': self.insert_mode,
                 'z': self.zoom_mode,
                 'x': self.pan_mode,
+                'l': self.lasso_mode,
                 'c': self.refocus_plot,
                 'tab': self.cycle_y_metric,
                 'space': self.cycle_x_metric,
@@ -602,9 +1504,25 @@ class ShowMyDesigns (gtk.Window):
         if self.keys:
             self.update_plot()
             self.update_annotations()
+            gobject.idle_add(self.prebuild_model_menus)
 
     def on_select_model(self, event):
-        self.selected_model = event.ind[0], event.artist.design
+        # The indices reported by the pick event refer to the points that were
+        # actually plotted, which may be a subset of several designs.
+        designs, design_indices, model_indices = event.artist.lookup
+        i = event.ind[0]
+        self.selected_model = model_indices[i], designs[design_indices[i]]
+
+    def on_select_region(self, vertices):
+        self.lasso.disconnect_events()
+        self.lasso = None
+
+        if len(vertices) >= 3:
+            self.selected_region = self.x_metric, self.y_metric, vertices
+        else:
+            self.selected_region = None
+
+        self.update_plot()
 
     def on_move_mouse_mpl(self, event):
         if event.xdata is None or event.ydata is None:
@@ -634,77 +1552,52 @@ class ShowMyDesigns (gtk.Window):
         # Figure out which model was clicked.
 
         index, design = self.selected_model
-        rep_index = design.representative
-        path = os.path.join(design.directory, design.paths[index])
-        rep_path = os.path.join(design.directory, design.paths[rep_index])
-        is_rep = (index == rep_index)
+        self.clicked_model = index, design
         self.selected_model = None
 
-        # Search for scripts that can perform some action using the clicked
-        # model.  Such scripts must have the `*.sho' suffix and may be located
-        # anywhere from the directory containing the models to any directory
-        # below that.  Any scripts that are found will be used to populate a
-        # drop-down menu.  If selected, the script will be called with sh as
-        # the interpreter and the path to the model as the singular argument.
-
-        directory = os.path.abspath(design.directory)
-        sho_scripts = []
-
-        while directory != os.path.abspath('/'):
-            sho_pattern = os.path.join(directory, '*.sho')
-            sho_scripts += glob.glob(sho_pattern)
-            directory = os.path.dirname(directory)
-
-        # Create and display the drop-down menu.
-
-        file_menu = gtk.Menu()
+        # Show the menu of things that can be done with the clicked model.
+        # The menus are built ahead of time, see get_model_menu().
 
-        for script in sho_scripts:
-            title = os.path.basename(os.path.splitext(script)[0])
-            title = title[0].upper() + title[1:]
-            title = title.replace('_', ' ')
+        menu, choose_rep = self.get_model_menu(design)
 
-            item = gtk.MenuItem(title)
-            item.connect('activate',
-                    lambda *args: try_to_run_command([script, path, rep_path]))
-            file_menu.append(item)
-
-        view_in_pymol = gtk.MenuItem("View model in pymol")
-        view_in_pymol.connect('activate',
-                lambda *args: try_to_run_command(['pymol', path]))
-        file_menu.append(view_in_pymol)
+        if index == design.representative:
+            choose_rep.set_label("Reset representative")
+        else:
+            choose_rep.set_label("Set as representative")
 
-        view_in_chimera = gtk.MenuItem("View model in chimera")
-        view_in_chimera.connect('activate',
-                lambda *args: try_to_run_command(['chimera', path]))
-        file_menu.append(view_in_chimera)
+        menu.popup(None, None, None, event.button, event.time)
 
-        file_menu.append(gtk.SeparatorMenuItem())
+    def on_run_script(self, widget, script):
+        path, rep_path = self.get_clicked_paths()
+        if path is None: return
+        try_to_run_command([script, path, rep_path])
 
-        copy_path = gtk.MenuItem("Copy path to model")
-        copy_path.connect('activate', self.on_copy_model_path, path)
-        file_menu.append(copy_path)
+    def on_view_model(self, widget, program, replace=True):
+        path, rep_path = self.get_clicked_paths()
+        if path is None: return
 
-        if index == design.representative:
-            choose_rep = gtk.MenuItem("Reset representative")
-            choose_rep.connect(
-                'activate', self.on_set_representative, design, None)
+        if self.viewer_sessions and program in self.viewer_sessions:
+            try:
+                self.viewer_sessions[program].load(path, replace)
+            except OSError as error:
+                show_error_dialog("Failed to run {}".format(program), error)
         else:
-            choose_rep = gtk.MenuItem("Set as representative")
-            choose_rep.connect(
-                'activate', self.on_set_representative, design, index)
-        file_menu.append(choose_rep)
-
-        file_menu.foreach(lambda item: item.show())
-        file_menu.popup(None, None, None, event.button, event.time)
+            try_to_run_command([program, path])
 
-    def on_copy_model_path(self, widget, path):
+    def on_copy_model_path(self, widget):
         import subprocess
+        path, rep_path = self.get_clicked_paths()
+        if path is None: return
         xsel = subprocess.Popen(['xsel', '-pi'], stdin=subprocess.PIPE)
         xsel.communicate(path)
 
-    def on_set_representative(self, widget, design, index):
-        design.representative = index
+    def on_set_representative(self, widget):
+        index, design = self.clicked_model
+        if index == design.representative:
+            design.representative = None
+        else:
+            design.representative = index
+        self.update_design_row(design)
         self.update_plot()
 
     def on_edit_annotation(self, buffer):
@@ -757,9 +1650,30 @@ class ShowMyDesigns (gtk.Window):
         else:
             self.hide_model_count()
 
+    def on_toggle_pareto_front(self, widget):
+        if widget.get_active():
+            self.show_pareto_front()
+        else:
+            self.hide_pareto_front()
+
+    def on_toggle_histograms(self, widget):
+        if widget.get_active():
+            self.show_histograms()
+        else:
+            self.hide_histograms()
+
+    def on_toggle_downsampling(self, widget):
+        if widget.get_active():
+            self.enable_downsampling()
+        else:
+            self.disable_downsampling()
+
 
     def normal_mode(self):
         self.set_focus(None)
+        if self.lasso is not None:
+            self.lasso.disconnect_events()
+            self.lasso = None
 
         if self.toolbar._active == 'PAN':
             self.toolbar.pan()
@@ -779,6 +1693,20 @@ class ShowMyDesigns (gtk.Window):
     def pan_mode(self):
         self.toolbar.pan()
 
+    def lasso_mode(self):
+        """
+        Let the user draw a lasso around a region of the plot, see
+        on_select_region().  Panning or zooming is turned off first, because
+        they use the same mouse button.
+        """
+        from matplotlib.widgets import LassoSelector
+
+        if self.toolbar._active == 'PAN': self.toolbar.pan()
+        if self.toolbar._active == 'ZOOM': self.toolbar.zoom()
+
+        if self.lasso is None:
+            self.lasso = LassoSelector(self.axes, onselect=self.on_select_region)
+
     def refocus_plot(self):
         self.toolbar.home()
         self.normal_mode()
@@ -828,6 +1756,79 @@ class ShowMyDesigns (gtk.Window):
 
         self.toolbar.y_axis_menu.set_active(i)
 
+    def get_clicked_paths(self):
+        """
+        Return the paths to the clicked model and to the representative of its
+        design, or (None, None) if they couldn't be extracted from a silent
+        file.
+        """
+        index, design = self.clicked_model
+        try:
+            path = design.get_model_path(index)
+            rep_path = design.get_model_path(design.representative)
+        except IOError as error:
+            show_error_dialog("Failed to extract model", error)
+            return None, None
+        return path, rep_path
+
+    def get_model_menu(self, design):
+        """
+        Return the right-click menu for models from the given design, building
+        it first if necessary.  The menu includes every `*.sho' script found
+        in the design directory or any of its parents, so it is rebuilt if any
+        scripts have been added or removed since it was last built.
+        """
+        scripts = find_sho_scripts(design.directory)
+        cached_scripts, menu, choose_rep = \
+                self.model_menus.get(design, (None, None, None))
+
+        if menu is None or scripts != cached_scripts:
+            menu, choose_rep = self.setup_model_menu(scripts)
+            self.model_menus[design] = scripts, menu, choose_rep
+
+        return menu, choose_rep
+
+    def get_design_row(self, key):
+        """
+        Return the values to show in the design list for the given design.
+        These are calculated once and then cached.
+        """
+        if key not in self.design_rows:
+            row = []
+            for title, type, getter, direction in design_list_columns:
+                value = getter(self.designs[key])
+                if type is float and np.isnan(value):
+                    # NaN doesn't sort consistently, so give missing values
+                    # the worst possible value for the column instead.  That
+                    # puts them at the end of the list when it's sorted with
+                    # the best designs first.
+                    if direction == 'higher':
+                        value = -np.inf
+                    else:
+                        value = np.inf
+                row.append(type(value))
+            self.design_rows[key] = row
+
+        return self.design_rows[key]
+
+    def update_design_row(self, design):
+        keys = [k for k in self.designs if self.designs[k] is design]
+        for key in keys:
+            self.design_rows.pop(key, None)
+
+        model = self.view.get_model()
+        for row in model:
+            if row[0] in keys:
+                model.set(row.iter, *itertools.chain(*enumerate(
+                    self.get_design_row(row[0]), 1)))
+
+    def prebuild_model_menus(self):
+        for key in self.keys:
+            self.get_model_menu(self.designs[key])
+
+        # Returning False tells gobject not to call this again.
+        return False
+
     def reverse_cycle_x_metric(self):
         self.cycle_x_metric(-1)
 
@@ -851,22 +1852,87 @@ class ShowMyDesigns (gtk.Window):
         if response == gtk.RESPONSE_OK:
             selected_designs = [self.designs[key] for key in self.keys]
             with open(chooser.get_filename(), 'w') as file:
-                file.writelines(
-                        os.path.join(
-                            design.directory,
-                            design.paths[design.representative]) + '\n'
-                        for design in selected_designs)
+                for design in selected_designs:
+                    file.writelines(format_model_locations(
+                        *design.get_model_locations([design.representative])))
 
         chooser.destroy()
 
-    def save_selected_funnels(self):
-        from matplotlib.backends.backend_pdf import PdfPages
-        import matplotlib.pyplot as plt
+    def save_region_as_filter(self):
+        """
+        Turn the selected region into a metric that can be filtered on, and
+        add a filter that only keeps the models inside it.  The region is
+        remembered for the rest of the session, so it can still be used after
+        another region is selected.
+        """
+        if self.selected_region is None:
+            return
+
+        name = 'region_{}'.format(len(self.regions) + 1)
+        x_metric, y_metric, vertices = self.selected_region
+        self.regions[name] = self.selected_region
+        self.filter_metrics[name] = MetricInfo(
+                name,
+                title='Region {} ({} vs {})'.format(
+                    len(self.regions), x_metric, y_metric),
+                order=None,
+                guide=None,
+                limits=lambda x: (0, 1),
+                direction='higher',
+        )
 
-        selected_designs = [self.designs[key] for key in self.keys]
+        # The menus for existing filters share this store, so they'll offer
+        # the new region too.
+        for filterable, store in getattr(self, 'metric_stores', {}).items():
+            if filterable:
+                store.append([name, self.filter_metrics[name].title])
+
+        self.clear_region()
+        self.show_filter_pane()
+        self.filter_pane.add_filter(name, '=', '1')
+
+    def save_region_paths(self):
+        if self.selected_region is None:
+            return
 
         chooser = gtk.FileChooserDialog(
-                "Save selected funnels",
+                "Save paths in region",
+                parent=self,
+                action=gtk.FILE_CHOOSER_ACTION_SAVE,
+                buttons=(
+                    gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                    gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+
+        chooser.set_current_folder(os.getcwd())
+        chooser.set_current_name('region_paths.txt')
+
+        response = chooser.run()
+
+        if response == gtk.RESPONSE_OK:
+            selected_designs = [self.designs[key] for key in self.keys]
+            with open(chooser.get_filename(), 'w') as file, render_lock:
+                for design in selected_designs:
+                    keep, drop = self.filter_pane.get_masks(design)
+                    inside = design.get_region_mask(*self.selected_region)
+                    file.writelines(format_model_locations(
+                        *design.get_model_locations(
+                            np.flatnonzero(inside & keep))))
+
+        chooser.destroy()
+
+    def clear_region(self):
+        if self.selected_region is not None:
+            self.selected_region = None
+            self.update_plot()
+
+    def save_selected_funnels(self):
+        from matplotlib.backends.backend_pdf import PdfPages
+        import matplotlib.pyplot as plt
+
+        selected_designs = [self.designs[key] for key in self.keys]
+
+        chooser = gtk.FileChooserDialog(
+                "Save selected funnels",
                 parent=self,
                 action=gtk.FILE_CHOOSER_ACTION_SAVE,
                 buttons=(
@@ -885,15 +1951,44 @@ class ShowMyDesigns (gtk.Window):
                 plt.figure(figsize=(8.5, 11))
                 plt.suptitle(design.directory)
 
-                self.plot_models(plt.gca(), [design])
-
-                pdf.savefig()
+                with render_lock:
+                    self.plot_models(plt.gca(), [design])
+                    pdf.savefig()
                 plt.close()
 
             pdf.close()
 
         chooser.destroy()
 
+    def export_filtered_models(self):
+        """
+        Write the metrics for every model in the selected designs that passes
+        the filters in the filter pane to a CSV file, see export_models().
+        """
+        chooser = gtk.FileChooserDialog(
+                "Export filtered models",
+                parent=self,
+                action=gtk.FILE_CHOOSER_ACTION_SAVE,
+                buttons=(
+                    gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                    gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+
+        chooser.set_current_folder(os.getcwd())
+        chooser.set_current_name('filtered_models.csv.gz')
+
+        response = chooser.run()
+
+        if response == gtk.RESPONSE_OK:
+            with render_lock:
+                export_models(
+                        chooser.get_filename(),
+                        [self.designs[key] for key in self.keys],
+                        lambda design: self.filter_pane.get_masks(
+                            design, update_counters=False)[0],
+                        columns=self.sorted_metrics)
+
+        chooser.destroy()
+
     def hide_model_list(self):
         self.model_list.hide()
         self.model_list_toggle.set_active(False)
@@ -990,12 +2085,141 @@ class ShowMyDesigns (gtk.Window):
         else:
             self.show_model_count()
 
+    def hide_pareto_front(self):
+        if self.is_pareto_front_visible:
+            self.is_pareto_front_visible = False
+            self.pareto_front_toggle.set_active(False)
+            self.update_plot()
+
+    def show_pareto_front(self):
+        if not self.is_pareto_front_visible:
+            self.is_pareto_front_visible = True
+            self.pareto_front_toggle.set_active(True)
+            self.update_plot()
+
+    def toggle_pareto_front(self):
+        if self.is_pareto_front_visible:
+            self.hide_pareto_front()
+        else:
+            self.show_pareto_front()
+
+    def hide_histograms(self):
+        if self.is_histograms_visible:
+            self.is_histograms_visible = False
+            self.histograms_toggle.set_active(False)
+            self.axes.set_position(plot_position)
+            for axes in self.histogram_axes:
+                axes.set_visible(False)
+            self.update_plot()
+
+    def show_histograms(self):
+        if not self.is_histograms_visible:
+            self.is_histograms_visible = True
+            self.histograms_toggle.set_active(True)
+            self.axes.set_position(plot_position_with_histograms)
+            for axes in self.histogram_axes:
+                axes.set_visible(True)
+            self.update_plot()
+
+    def toggle_histograms(self):
+        if self.is_histograms_visible:
+            self.hide_histograms()
+        else:
+            self.show_histograms()
+
+    def disable_downsampling(self):
+        if self.is_downsampling_enabled:
+            self.is_downsampling_enabled = False
+            self.downsampling_toggle.set_active(False)
+            self.update_plot()
+
+    def enable_downsampling(self):
+        if not self.is_downsampling_enabled:
+            self.is_downsampling_enabled = True
+            self.downsampling_toggle.set_active(True)
+            self.update_plot()
+
+    def toggle_downsampling(self):
+        if self.is_downsampling_enabled:
+            self.disable_downsampling()
+        else:
+            self.enable_downsampling()
+
+    def get_metric(self, design, metric):
+        """
+        Return the given metric for the given design, including metrics that
+        depend on the state of the GUI (e.g. which metrics are being plotted).
+        """
+        if metric == 'pareto_front':
+            return pd.Series(design.get_pareto_front(self.x_metric, self.y_metric))
+        elif metric in self.regions:
+            return pd.Series(design.get_region_mask(*self.regions[metric]))
+        else:
+            return design.get_metric(metric)
+
+    def get_metric_limits(self, metric):
+        """
+        Return the axis limits for the given metric.  These are based on the
+        range of every design, so you can scroll through every design without
+        the axes changing size.
+        """
+        if metric not in self.metric_limits:
+            values = np.concatenate([x.get_limit_values(metric) for x in self])
+            self.metric_limits[metric] = self.metrics[metric].limits(values)
+        return self.metric_limits[metric]
+
+    def get_histogram_bins(self, metric):
+        """
+        Return the bin edges used for histograms of the given metric.  The bins
+        span the axis limits (with the same padding as the plot), and are the
+        same for every design so that each design only has to sort its models
+        into bins once, see Design.get_histogram().
+        """
+        if metric not in self.histogram_bins:
+            lower, upper = self.get_metric_limits(metric)
+            pad = 0.05 * (upper - lower)
+            self.histogram_bins[metric] = np.linspace(
+                    lower - pad, upper + pad, num_histogram_bins + 1)
+        return self.histogram_bins[metric]
+
+    @profiler.timed('ShowMyDesigns.plot_models')
     def plot_models(self, axes, designs, **kwargs):
         from itertools import count
 
         labels = kwargs.get('labels', None)
-        x_metric = kwargs.get('x_metric', self.x_metric)
-        y_metric = kwargs.get('y_metric', self.y_metric)
+
+        # The filter masks and the plot options (see get_plot_options()) can
+        # be given explicitly, which is necessary when plotting from a
+        # background thread (see prerender_plots()), because both are read
+        # from widgets.
+        masks = kwargs.get('masks', None)
+        options = kwargs.get('options', None) or self.get_plot_options()
+
+        x_metric = options['x_metric']
+        y_metric = options['y_metric']
+
+        def get_masks(index, design): #
+            if masks is not None:
+                return masks[index]
+            return self.filter_pane.get_masks(design)
+
+        # The marginal histograms are only drawn if axes are given for them,
+        # as an (x, y) tuple.
+        histogram_axes = kwargs.get('histogram_axes', None)
+
+        # Thin out large designs if the user asked for it, see
+        # downsample_models().  Out-of-core designs are always thinned out.
+
+        max_points = max_plotted_points \
+                if options['is_downsampling_enabled'] else None
+
+        def get_plot_mask(design): #
+            return design.get_plot_mask(x_metric, y_metric, max_points)
+
+        def format_model_count(num_shown, num_total): #
+            if num_shown < num_total:
+                return '{}/{}'.format(num_shown, num_total)
+            return str(num_total)
 
         # Define the colors that the plot will use.
 
@@ -1011,7 +2235,14 @@ class ShowMyDesigns (gtk.Window):
         def color_from_cycle(index): #
             cycle = (blue[1], red[1], green[2], orange[1], purple[1], brown[1],
                      blue[0], red[0], green[1], orange[0], purple[0], brown[0])
-            return cycle[index % len(cycle)]
+            if index < len(cycle):
+                return cycle[index]
+
+            # Once the cycle runs out, spread the remaining colors around the
+            # color wheel using the golden ratio, so that neighboring designs
+            # still get distinct colors.
+            hue = (index - len(cycle)) * 0.618033988749895 % 1
+            return matplotlib.colors.hsv_to_rgb((hue, 0.7, 0.8))
 
         # Clear the axes and reset the axis labels
 
@@ -1019,53 +2250,134 @@ class ShowMyDesigns (gtk.Window):
         axes.set_xlabel(self.metrics[x_metric].title)
         axes.set_ylabel(self.metrics[y_metric].title)
 
-        # Plot the two axes.
-
-        for index, design in enumerate(designs):
-            rep = design.representative
-            color = color_from_cycle(index)
-            label = labels[index] if labels is not None else ''
-            action = self.filter_pane.get_action()
-            keep, drop = self.filter_pane.get_masks(design)
-
-            x = design.get_metric(x_metric)
-            y = design.get_metric(y_metric)
+        # Plot the two axes.  If there are lots of designs, draw them all with
+        # a single collection instead of several artists per design.
+
+        action = options['action']
+
+        all_masks = [get_masks(*x) for x in enumerate(designs)]
+
+        def plot_overlay(): #
+            # Work with plain numpy arrays here; indexing pandas objects is
+            # slow enough to dominate the plot when there are many designs.
+            masks = all_masks
+            xs = [x.get_metric(x_metric).values for x in designs]
+            ys = [x.get_metric(y_metric).values for x in designs]
+
+            # Only plot a sample of the models in very large designs.
+            plotted = [
+                    (keep & shown, drop & shown)
+                    for (keep, drop), shown in zip(masks, [
+                        get_plot_mask(x) for x in designs])]
+            counts = [np.count_nonzero(keep) for keep, drop in plotted]
+
+            # Remember which design and model each point came from, so that
+            # picking still works.
+            design_indices = np.repeat(np.arange(len(designs)), counts)
+            model_indices = np.concatenate([
+                np.flatnonzero(keep) for keep, drop in plotted])
+
+            palette = matplotlib.colors.colorConverter.to_rgba_array(
+                    [color_from_cycle(i) for i in range(len(designs))])
+            size = np.clip(7500 / max(sum(counts), 1), 1, 15)
+
+            if options['is_representative_visible']:
+                indices = [x.representative for x in designs]
+                reps = [(x[i], y[i])
+                        for i, x, y, (keep, drop) in zip(indices, xs, ys, masks)
+                        if keep[i]]
+                if reps:
+                    axes.scatter(
+                            *zip(*reps),
+                            s=60, c=yellow[1], marker='o', edgecolor='none',
+                            label='_nolabel_')
+
+            def scatter(x, y, color, **kwargs): #
+                # The axis limits are set explicitly below, so add the points
+                # after creating the collection.  This skips matplotlib's
+                # autoscaling, which is slow for this many points.
+                collection = axes.scatter(
+                        [], [], s=size, marker='o', edgecolor='none',
+                        label='_nolabel_', **kwargs)
+                collection.set_offsets(np.column_stack([x, y]))
+                collection.set_facecolor(color)
+                return collection
 
-            # Scale the size of the points by the number of points.
-            size = np.clip(7500 / max(len(x), 1), 2, 15)
-
-            # Highlight the representative model.
-            if self.is_representative_visible and keep[rep]:
-                axes.scatter(
-                        [x[rep]], [y[rep]],
-                        s=60, c=yellow[1], marker='o', edgecolor='none',
-                        label='_nolabel_')
-
-            # Highlight the filtered points, if that's what the user wants.
             if action == 'highlight':
-                axes.scatter(
-                        x[drop], y[drop],
-                        s=size, c=grey[4], marker='o', edgecolor='none',
-                        label='_nolabel_')
+                scatter(
+                        np.concatenate([x[drop] for x, (k, drop) in zip(xs, plotted)]),
+                        np.concatenate([y[drop] for y, (k, drop) in zip(ys, plotted)]),
+                        grey[4])
 
-            # Draw the whole score vs distance plot.
-            lines = axes.scatter(
-                    x[keep], y[keep],
-                    s=size, c=color, marker='o', edgecolor='none',
-                    label=label, picker=True)
+            lines = scatter(
+                    np.concatenate([x[keep] for x, (keep, d) in zip(xs, plotted)]),
+                    np.concatenate([y[keep] for y, (keep, d) in zip(ys, plotted)]),
+                    palette[design_indices], picker=True)
 
-            lines.paths = design.paths
-            lines.design = design
+            lines.lookup = designs, design_indices, model_indices
+
+        if len(designs) > max_separate_designs:
+            plot_overlay()
+        else:
+            for index, design in enumerate(designs):
+                rep = design.representative
+                color = color_from_cycle(index)
+                label = labels[index] if labels is not None else ''
+                keep, drop = all_masks[index]
+
+                x = design.get_metric(x_metric)
+                y = design.get_metric(y_metric)
+
+                # Only plot a sample of the models in very large designs.
+                shown = get_plot_mask(design)
+
+                # Scale the size of the points by the number of points.
+                size = np.clip(7500 / max(np.count_nonzero(shown), 1), 2, 15)
+
+                # Highlight the representative model.
+                if options['is_representative_visible'] and keep[rep]:
+                    axes.scatter(
+                            [x[rep]], [y[rep]],
+                            s=60, c=yellow[1], marker='o', edgecolor='none',
+                            label='_nolabel_')
+
+                # Highlight the filtered points, if that's what the user wants.
+                if action == 'highlight':
+                    axes.scatter(
+                            x[drop & shown], y[drop & shown],
+                            s=size, c=grey[4], marker='o', edgecolor='none',
+                            label='_nolabel_')
+
+                # Draw the whole score vs distance plot.
+                lines = axes.scatter(
+                        x[keep & shown], y[keep & shown],
+                        s=size, c=color, marker='o', edgecolor='none',
+                        label=label, picker=True)
+
+                lines.lookup = [design], \
+                        np.zeros(np.count_nonzero(keep & shown), dtype=int), \
+                        np.flatnonzero(keep & shown)
+
+                # Outline the models that are on the Pareto front, i.e. that
+                # aren't beaten on both axes by any other model.
+                if options['is_pareto_front_visible']:
+                    front = design.get_pareto_front(x_metric, y_metric) & keep
+                    order = np.argsort(x[front].values)
+                    axes.plot(
+                            x[front].values[order], y[front].values[order],
+                            color=color, linewidth=1, drawstyle='steps-post',
+                            label='_nolabel_')
+                    axes.scatter(
+                            x[front], y[front],
+                            s=max(size, 10) * 2, c='none', marker='o',
+                            edgecolor=color, linewidth=1, label='_nolabel_')
 
         # Pick the axis limits based on the range of every design.  This is done
         # so you can scroll though every design without the axes changing size.
 
-        def get_metric_limits(metric): #
-            values = np.concatenate([x.get_metric(metric) for x in self])
-            return self.metrics[metric].limits(values)
-
-        x_min, x_max = get_metric_limits(x_metric)
-        y_min, y_max = get_metric_limits(y_metric)
+        with profiler.section('ShowMyDesigns.plot_models: limits'):
+            x_min, x_max = self.get_metric_limits(x_metric)
+            y_min, y_max = self.get_metric_limits(y_metric)
 
         x_pad = 0.05 * (x_max - x_min)
         y_pad = 0.05 * (y_max - y_min)
@@ -1081,8 +2393,8 @@ class ShowMyDesigns (gtk.Window):
 
         # Draw guides for axes the that have them.
 
-        x_guide = self.metrics[self.x_metric].guide
-        y_guide = self.metrics[self.y_metric].guide
+        x_guide = self.metrics[x_metric].guide
+        y_guide = self.metrics[y_metric].guide
 
         if x_guide is not None:
             axes.axvline(x_guide, color=grey[3], linestyle='--')
@@ -1091,17 +2403,135 @@ class ShowMyDesigns (gtk.Window):
 
         # Draw the legend if the user enabled it.
 
-        if self.is_legend_visible:
+        if options['is_legend_visible'] and len(designs) > max_separate_designs:
+            # The overlay is a single artist, so give the legend a proxy
+            # artist for each design, up to a point.
+            handles = [
+                    matplotlib.lines.Line2D(
+                        [], [], color=color_from_cycle(i),
+                        marker='o', linestyle='none')
+                    for i in range(min(len(designs), max_legend_entries))]
+            texts = list(labels or [''] * len(designs))[:len(handles)]
+            if len(designs) > len(handles):
+                handles.append(matplotlib.lines.Line2D([], [], linestyle='none'))
+                texts.append('{} more...'.format(len(designs) - len(texts)))
+            axes.legend(handles, texts, loc='upper right')
+
+        elif options['is_legend_visible']:
             axes.legend(loc='upper right')
 
-        if self.is_model_count_visible:
+        if options['is_model_count_visible'] and len(designs) > max_separate_designs:
+            axes.annotate(
+                    '{} models in {} designs'.format(format_model_count(
+                        sum(np.count_nonzero(get_plot_mask(x)) for x in designs),
+                        sum(len(x) for x in designs)), len(designs)),
+                    xy=(0, 1), xycoords='axes fraction',
+                    xytext=(8, -8), textcoords='offset points',
+                    verticalalignment='top',
+            )
+
+        elif options['is_model_count_visible']:
             axes.annotate(
-                    ', '.join(str(len(x)) for x in designs),
+                    ', '.join(
+                        format_model_count(
+                            np.count_nonzero(get_plot_mask(x)), len(x))
+                        for x in designs),
                     xy=(0, 1), xycoords='axes fraction',
                     xytext=(8, -8), textcoords='offset points',
                     verticalalignment='top',
             )
 
+        # Outline the selected region, and summarize the models inside it that
+        # pass the filters.  The region is only drawn on the axes it was
+        # selected on.
+
+        region = options['selected_region']
+
+        if region is not None and region[:2] == (x_metric, y_metric):
+            axes.add_patch(matplotlib.patches.Polygon(
+                    region[2], closed=True, facecolor=yellow[0], alpha=0.2,
+                    edgecolor=grey[1], linestyle='--', zorder=0, label='_nolabel_'))
+
+            summary = summarize_region(
+                    designs, [keep_drop[0] for keep_drop in all_masks], region)
+            lines = [
+                    '{}: {} models, best {}'.format(
+                        name, num_inside, format_value(best))
+                    for name, (num_inside, best) in zip(
+                        labels or [''] * len(designs), summary)]
+            if len(lines) > max_legend_entries:
+                lines[max_legend_entries:] = ['{} more...'.format(
+                        len(lines) - max_legend_entries)]
+            if len(designs) > 1:
+                lines.insert(0, '{} models in region'.format(
+                        sum(n for n, best in summary)))
+
+            axes.annotate(
+                    '\n'.join(lines),
+                    xy=(1, 0), xycoords='axes fraction',
+                    xytext=(-8, 8), textcoords='offset points',
+                    horizontalalignment='right', verticalalignment='bottom',
+                    bbox=dict(facecolor='white', edgecolor=grey[3], alpha=0.8),
+            )
+
+        # Draw the marginal histograms.  The grey histogram is every model in
+        # the selected designs, the colored ones are the models that pass the
+        # filters, as a fraction of the models in each design.  If there are
+        # lots of designs, they share a single colored histogram.
+
+        if histogram_axes is not None:
+            if len(designs) > max_separate_designs:
+                groups = [(blue[1], range(len(designs)))]
+            else:
+                groups = [(color_from_cycle(i), [i]) for i in range(len(designs))]
+
+            num_models = sum(len(x) for x in designs)
+
+            def plot_histogram(hist_axes, metric, is_vertical): #
+                bins = self.get_histogram_bins(metric)
+                edges = np.repeat(bins, 2)[1:-1]
+
+                def step(indices, masks=None): #
+                    counts = sum(
+                            designs[i].get_histogram(
+                                metric, bins, masks[i][0] if masks else None)
+                            for i in indices)
+                    total = sum(len(designs[i]) for i in indices)
+                    return np.repeat(counts / float(max(total, 1)), 2)
+
+                # Don't let the histogram change the limits of the axis it
+                # shares with the plot.
+                hist_axes.clear()
+                if is_vertical:
+                    hist_axes.set_autoscaley_on(False)
+                else:
+                    hist_axes.set_autoscalex_on(False)
+
+                fill = hist_axes.fill_betweenx if is_vertical \
+                        else hist_axes.fill_between
+                fill(edges, 0, step(range(len(designs))), color=grey[4],
+                        linewidth=0)
+
+                for color, indices in groups:
+                    heights = step(indices, all_masks)
+                    if is_vertical:
+                        hist_axes.plot(heights, edges, color=color, linewidth=1)
+                    else:
+                        hist_axes.plot(edges, heights, color=color, linewidth=1)
+
+                hist_axes.tick_params(
+                        labelbottom=False, labelleft=False,
+                        bottom=not is_vertical, left=is_vertical)
+                if is_vertical:
+                    hist_axes.set_xlim(left=0)
+                else:
+                    hist_axes.set_ylim(bottom=0)
+
+            with profiler.section('ShowMyDesigns.plot_models: histograms'):
+                if num_models:
+                    plot_histogram(histogram_axes[0], x_metric, False)
+                    plot_histogram(histogram_axes[1], y_metric, True)
+
 
     def update_everything(self):
         self.update_annotations()
@@ -1109,9 +2539,156 @@ class ShowMyDesigns (gtk.Window):
         self.update_designs()
 
     def update_plot(self):
+        """
+        Schedule the plot to be redrawn once the main loop is idle.  A single
+        action often calls this several times (e.g. via cascading signals),
+        but the plot will only be drawn once.
+        """
+        if not self.is_plot_dirty:
+            self.is_plot_dirty = True
+            gobject.idle_add(self.redraw_plot)
+
+    @profiler.timed('ShowMyDesigns.redraw_plot')
+    def redraw_plot(self):
+        self.is_plot_dirty = False
+
+        # Keep the last plot if nothing is selected, which happens briefly
+        # while the 'J' and 'K' hotkeys move the selection.
+        if not self.keys:
+            return False
+
+        self.num_redraws += 1
         designs = [self.designs[k] for k in self.keys]
-        self.plot_models(self.axes, designs, labels=self.keys)
-        self.canvas.draw()
+
+        # Plotting fills caches (e.g. the plot masks and the histogram bins)
+        # that plots being rendered in the background fill too.
+
+        with render_lock:
+            self.plot_models(
+                    self.axes, designs, labels=self.keys,
+                    histogram_axes=self.histogram_axes
+                        if self.is_histograms_visible else None)
+
+            # If this plot was already rendered in the background, just show
+            # that.  The artists are still created above, so picking works as
+            # usual.
+
+            if len(self.keys) == 1:
+                key = self.keys[0]
+                state, renderer = self.prerendered_plots.pop(key, (None, None))
+                if state == self.get_plot_state(key):
+                    self.canvas.prerendered = renderer
+
+        with profiler.section('ShowMyDesigns.redraw_plot: render'):
+            self.canvas.draw()
+
+        # Get the plots for the neighboring designs ready, so that the 'J' and
+        # 'K' hotkeys can show them without waiting.
+
+        if len(self.keys) == 1:
+            gobject.idle_add(self.prerender_neighbors)
+
+        return False
+
+    def get_plot_options(self):
+        """
+        Return the settings that affect how designs are plotted, other than
+        the filters.  This has to be called in the main thread, because the
+        filter action is read from a widget.
+        """
+        return dict(
+                x_metric=self.x_metric,
+                y_metric=self.y_metric,
+                action=self.filter_pane.get_action(),
+                is_legend_visible=self.is_legend_visible,
+                is_representative_visible=self.is_representative_visible,
+                is_model_count_visible=self.is_model_count_visible,
+                is_pareto_front_visible=self.is_pareto_front_visible,
+                is_downsampling_enabled=self.is_downsampling_enabled,
+                is_histograms_visible=self.is_histograms_visible,
+                selected_region=self.selected_region,
+        )
+
+    def get_plot_state(self, key, options=None):
+        """
+        Return everything that affects how the given design is plotted, so
+        that plots rendered in the background can be checked for staleness.
+        """
+        options = options or self.get_plot_options()
+        filters = tuple(
+                (x.get_name(), x.get_operator(), x.get_threshold())
+                for x in self.filter_pane.filters)
+
+        return (
+                key,
+                self.designs[key].representative,
+                tuple(sorted(options.items())),
+                filters,
+                tuple(self.canvas.figure.bbox.size),
+        )
+
+    def prerender_neighbors(self):
+        model, paths = self.view.get_selection().get_selected_rows()
+        if len(paths) != 1:
+            return False
+
+        row = paths[0][0]
+        neighbors = [
+                model[i][0] for i in (row + 1, row - 1)
+                if 0 <= i < len(model)]
+
+        # Forget about plots that aren't next to the current design anymore.
+
+        for key in self.prerendered_plots.keys():
+            if key not in neighbors:
+                del self.prerendered_plots[key]
+
+        # The filter masks and the plot options have to be read here, in the
+        # main thread, because they come from widgets.
+
+        options = self.get_plot_options()
+
+        jobs = []
+        with render_lock:
+            for key in neighbors:
+                state = self.get_plot_state(key, options)
+                if self.prerendered_plots.get(key, (None,))[0] == state:
+                    continue
+                masks = [self.filter_pane.get_masks(
+                    self.designs[key], update_counters=False)]
+                jobs.append((key, state, masks, options))
+
+        if jobs:
+            thread = threading.Thread(target=self.prerender_plots, args=(jobs,))
+            thread.daemon = True
+            thread.start()
+
+        return False
+
+    def prerender_plots(self, jobs):
+        """
+        Render the given designs into off-screen Agg buffers.  This is called
+        in a background thread, so it must not touch any GTK widgets.
+        """
+        for key, state, masks, options in jobs:
+            figure = Figure(
+                    figsize=self.canvas.figure.get_size_inches(),
+                    dpi=self.canvas.figure.dpi,
+                    facecolor=self.canvas.figure.get_facecolor())
+            canvas = FigureCanvasAgg(figure)
+            axes = figure.add_axes(self.axes.get_position().bounds)
+            histogram_axes = (
+                    figure.add_axes(x_histogram_position, sharex=axes),
+                    figure.add_axes(y_histogram_position, sharey=axes),
+            ) if options['is_histograms_visible'] else None
+
+            with render_lock:
+                self.plot_models(
+                        axes, [self.designs[key]], labels=[key], masks=masks,
+                        options=options, histogram_axes=histogram_axes)
+                canvas.draw()
+
+            self.prerendered_plots[key] = state, canvas.get_renderer()
 
     def update_annotations(self):
         if len(self.keys) == 1:
@@ -1121,6 +2698,7 @@ class ShowMyDesigns (gtk.Window):
         else:
             self.notes.set_sensitive(False)
 
+    @profiler.timed('ShowMyDesigns.update_designs')
     def update_designs(self):
         model = self.view.get_model()
         selector = self.view.get_selection()
@@ -1135,9 +2713,14 @@ class ShowMyDesigns (gtk.Window):
 
             return needle in haystack
 
+        # Score the funnels of every design at once, rather than one at a time
+        # as the rows are made.
+
+        score_funnels(self.designs.values())
+
         for key in sorted(self.designs):
             if query_matches_design(self.designs[key]):
-                model.append([key])
+                model.append([key] + self.get_design_row(key))
 
         selector.select_path((0,))
 
@@ -1147,6 +2730,34 @@ class FigureCanvas (FigureCanvasGTKAgg):
 
     def __init__(self, figure):
         FigureCanvasGTKAgg.__init__(self, figure)
+        self.prerendered = None
+
+    def _render_figure(self, pixmap, width, height):
+        # Use the renderer from a plot that was drawn in the background, if
+        # one was given and it's the right size.  This is only good for one
+        # draw, after that the figure is rendered normally again.
+
+        renderer, self.prerendered = self.prerendered, None
+        l, b, w, h = self.figure.bbox.bounds
+        key = w, h, self.figure.dpi
+
+        with render_lock:
+            if renderer is not None and \
+                    (renderer.width, renderer.height) == (w, h):
+                self.renderer = renderer
+                self._lastKey = key
+            else:
+                FigureCanvasAgg.draw(self)
+
+        buf = self.buffer_rgba()
+        ren = self.get_renderer()
+        w = int(ren.width)
+        h = int(ren.height)
+
+        pixbuf = gtk.gdk.pixbuf_new_from_data(
+            buf, gtk.gdk.COLORSPACE_RGB,  True, 8, w, h, w*4)
+        pixmap.draw_pixbuf(pixmap.new_gc(), pixbuf, 0, 0, 0, 0, w, h,
+                           gtk.gdk.RGB_DITHER_NONE, 0, 0)
 
     def button_press_event(self, widget, event):
         FigureCanvasGTKAgg.button_press_event(self, widget, event)
@@ -1210,26 +2821,50 @@ class FilterPane(gtk.Table):
     def get_action(self):
         return self.action_menu.get_active_text().lower()
 
-    def get_masks(self, design):
-        keep = np.ones(len(design), dtype='bool')
+    @profiler.timed('FilterPane.get_masks')
+    def get_masks(self, design, update_counters=True):
+        applied = []
 
         for filter in self.filters:
             name = filter.get_name()
             op = filter.get_operator()
             try: threshold = float(filter.get_threshold())
             except: continue
-
-            metric = design.get_metric(name)
-
-            if op == '>': result = metric > threshold
-            if op == '<': result = metric < threshold
-            if op == '>=': result = metric >= threshold
-            if op == '<=': result = metric <= threshold
-            if op == '==': result = metric == threshold
-            if op == '!=': result = metric != threshold
-
-            filter.update_counter(sum(result), len(result))
-            keep &= result
+            applied.append((filter, name, op, threshold))
+
+        # Filters on the design's own metrics are applied by the design, which
+        # lets a server apply them for designs it loaded (see server.py).  The
+        # other filters depend on the GUI, e.g. on which metrics are plotted.
+
+        design_filters = [x for x in applied if x[1] in design.metrics]
+        keep, num_passing = design.apply_filters(
+                [x[1:] for x in design_filters])
+        num_passing = dict(zip([x[0] for x in design_filters], num_passing))
+
+        for filter, name, op, threshold in applied:
+            if filter not in num_passing:
+                metric = self.master.get_metric(design, name)
+                result = apply_filter(metric, op, threshold)
+                num_passing[filter] = np.count_nonzero(result)
+                keep &= result
+
+        if update_counters:
+            for filter, name, op, threshold in applied:
+                filter.update_counter(num_passing[filter], len(design))
+
+        # Show the distribution of each filtered metric next to its filter,
+        # along with the models that pass every filter.  Metrics that aren't
+        # plotted (e.g. the Pareto front) don't have histograms.
+
+        if update_counters:
+            for filter, name, op, threshold in applied:
+                if name not in self.master.metrics:
+                    continue
+                bins = self.master.get_histogram_bins(name)
+                filter.update_histogram(
+                        design.get_histogram(name, bins),
+                        design.get_histogram(name, bins, keep),
+                        (threshold - bins[0]) / (bins[-1] - bins[0]))
 
         return keep, np.logical_not(keep)
 
@@ -1248,11 +2883,17 @@ class FilterPane(gtk.Table):
         combo_box.connect('changed', lambda _: self.emit('updated'))
         return combo_box
 
-    def add_filter(self):
+    def add_filter(self, name=None, operator=None, threshold=None):
         filter = self.Filter(self)
         self.filters.append(filter)
         self.update_num_rows()
 
+        if name is not None: filter.set_name(name)
+        if operator is not None: filter.set_operator(operator)
+        if threshold is not None:
+            filter.set_threshold(threshold)
+            self.emit('updated')
+
     def remove_filter(self, filter):
         self.filters.remove(filter)
         self.update_num_rows()
@@ -1271,7 +2912,7 @@ class FilterPane(gtk.Table):
 
         # Make the table the right size.
         rows = max(len(self.filters) + 2, 2)
-        self.resize(rows, 6)
+        self.resize(rows, 7)
 
         # Re-attach everything to the table.
         fill = dict(xoptions=gtk.FILL, yoptions=gtk.FILL)
@@ -1294,12 +2935,16 @@ class FilterPane(gtk.Table):
 
         def __init__(self, table):
             self.table = table
-            self.filter_menu = table.master.setup_metric_menu()
+            self.filter_menu = table.master.setup_metric_menu(filterable=True)
             self.operator_menu = make_operator_menu()
             self.threshold_entry = gtk.Entry()
             self.threshold_entry.set_width_chars(5)
             self.delete_button = make_stock_button(gtk.STOCK_CANCEL)
             self.counter = gtk.Label()
+            self.sparkline = gtk.DrawingArea()
+            self.sparkline.set_size_request(80, 20)
+            self.sparkline.connect('expose-event', self.on_draw_sparkline)
+            self.histogram = None
 
             self.filter_menu.connect('changed', lambda _: table.emit('updated'))
             self.operator_menu.connect('changed', lambda _: table.emit('updated'))
@@ -1321,31 +2966,359 @@ class FilterPane(gtk.Table):
         def get_threshold(self):
             return self.threshold_entry.get_text()
 
+        def set_name(self, name):
+            for i, row in enumerate(self.filter_menu.get_model()):
+                if row[0] == name:
+                    self.filter_menu.set_active(i)
+
+        def set_operator(self, operator):
+            for i, row in enumerate(self.operator_menu.get_model()):
+                if row[0] == operator:
+                    self.operator_menu.set_active(i)
+
+        def set_threshold(self, threshold):
+            self.threshold_entry.set_text(threshold)
+
         def attach(self, i, **fill):
             self.table.attach(self.filter_menu,      1, 2, i, i+1, **fill)
             self.table.attach(self.operator_menu,    2, 3, i, i+1, **fill)
             self.table.attach(self.threshold_entry,  3, 4, i, i+1, **fill)
             self.table.attach(self.delete_button,    4, 5, i, i+1, **fill)
             self.table.attach(self.counter,          5, 6, i, i+1, **fill)
+            self.table.attach(self.sparkline,        6, 7, i, i+1, **fill)
 
         def update_counter(self, num_kept, num_total):
             self.counter.set_text('{}/{}'.format(num_kept, num_total))
 
+        def update_histogram(self, counts, kept_counts, threshold):
+            """
+            Show the given histograms in the sparkline next to this filter.
+            The threshold is given as a fraction of the width of the bins.
+            """
+            self.histogram = counts, kept_counts, threshold
+            self.sparkline.queue_draw()
+
+        def on_draw_sparkline(self, widget, event):
+            if self.histogram is None:
+                return
+
+            counts, kept_counts, threshold = self.histogram
+            width = widget.allocation.width
+            height = widget.allocation.height
+            bar_width = width / float(len(counts))
+            bar_scale = height / float(max(counts.max(), 1))
+
+            context = widget.window.cairo_create()
+
+            for color, values in (('#d3d7cf', counts), ('#3465a4', kept_counts)):
+                context.set_source_rgb(
+                        *matplotlib.colors.colorConverter.to_rgb(color))
+                for i in np.flatnonzero(values):
+                    context.rectangle(
+                            i * bar_width, height - values[i] * bar_scale,
+                            bar_width, values[i] * bar_scale)
+                context.fill()
+
+            if 0 <= threshold <= 1:
+                context.set_source_rgb(
+                        *matplotlib.colors.colorConverter.to_rgb('#cc0000'))
+                context.rectangle(int(threshold * width), 0, 1, height)
+                context.fill()
+
 
 
 class MetricInfo(object):
 
-    def __init__(self, name, title, order, guide, limits):
+    def __init__(self, name, title, order, guide, limits, direction='lower'):
         self.name = name
         self.title = title
         self.order = order
         self.guide = guide
         self.limits = limits
+        self.direction = direction
 
     def __repr__(self):
         return '<MetricInfo name="{0}">'.format(self.name)
 
 
+class DerivedMetric(object):
+
+    def __init__(self, name, expression, variables):
+        self.name = name
+        self.expression = expression
+        self.variables = variables
+
+    def __repr__(self):
+        return '<DerivedMetric name="{0}" expression="{1}">'.format(
+                self.name, self.expression)
+
+
+class Extractor(object):
+
+    def __init__(self, name, version, function, footer_only=True):
+        self.name = name
+        self.version = version
+        self.function = function
+        self.footer_only = footer_only
+
+    def __repr__(self):
+        return '<Extractor name="{0}" version={1}>'.format(
+                self.name, self.version)
+
+
+class RepresentativeRule(object):
+
+    def __init__(self, name, function, incremental=False):
+        self.name = name
+        self.function = function
+        self.incremental = incremental
+
+    def __repr__(self):
+        return '<RepresentativeRule name="{0}">'.format(self.name)
+
+
+class MappedModels (object):
+    """
+    A read-only stand-in for the data frame of metrics in designs that are
+    loaded out-of-core.  Each metric is stored in its own `.npy` file, which is
+    memory-mapped rather than read, so the operating system only keeps the
+    parts that are actually being used in memory.
+    """
+
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = collections.OrderedDict(
+                (x, np.load(os.path.join(directory, x + '.npy'), mmap_mode='r'))
+                for x in columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __getitem__(self, column):
+        return pd.Series(self.columns[column], copy=False)
+
+    def keys(self):
+        return self.columns.keys()
+
+    @property
+    def dtypes(self):
+        return pd.Series({k: v.dtype for k, v in self.columns.items()})
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def memory_usage(self, index=False, deep=False):
+        # The mapped files don't count against the memory of this process.
+        return pd.Series(0, index=self.columns.keys())
+
+
+class SilentIndex(object):
+    """
+    Where each model in a design made of rosetta silent files is stored: the
+    silent file it's in, and the offset and length of its block (which starts
+    with its SCORE line).  The header of each silent file is kept, so that any
+    one model can be written out as a silent file of its own.
+    """
+
+    def __init__(self, files, headers, file_indices, offsets, lengths):
+        self.files = files
+        self.headers = headers
+        self.file_indices = np.array(file_indices, dtype=np.int32)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.lengths = np.array(lengths, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def read_model(self, directory, index):
+        """
+        Return a silent file containing only the given model, by seeking
+        straight to it.
+        """
+        i = self.file_indices[index]
+        with open(os.path.join(directory, self.files[i]), 'rb') as file:
+            file.seek(self.offsets[index])
+            return self.headers[i] + file.read(self.lengths[index])
+
+    def extract_pdb(self, directory, index):
+        """
+        Write the given model to a temporary PDB file and return its path.
+        Each model is only extracted once per session.
+        """
+        key = os.path.realpath(directory), index
+        if key not in extracted_silent_models:
+            extracted_silent_models[key] = \
+                    extract_silent_model(self.read_model(directory, index))
+        return extracted_silent_models[key]
+
+
+class ModelPaths(object):
+    """
+    A compact, read-only list of the file names of the models in a design.
+
+    Python strings take about 60 bytes of overhead each, which adds up when a
+    design has hundreds of thousands of models.  Model names usually differ
+    only by a number (e.g. 'model_000001.pdb.gz'), in which case only the
+    common prefix and suffix and an array of integers are stored.  Otherwise
+    the names are stored in a fixed-width byte array.
+    """
+
+    def __init__(self, names):
+        names = list(names)
+        self.prefix, self.suffix = '', ''
+        self.width = 0
+        self.numbers = None
+        self.names = None
+
+        if names:
+            prefix = os.path.commonprefix(names)
+            suffix = os.path.commonprefix([x[len(prefix):][::-1] for x in names])[::-1]
+            middles = [x[len(prefix):len(x) - len(suffix)] for x in names]
+            widths = set(len(x) for x in middles)
+
+            # The names can only be reconstructed from the numbers if the
+            # numbers are either padded to a constant width or not padded.
+            is_numeric = all(x.isdigit() for x in middles) and (
+                    len(widths) == 1 or
+                    not any(x.startswith('0') for x in middles))
+
+            if is_numeric:
+                self.prefix, self.suffix = prefix, suffix
+                self.width = widths.pop() if len(widths) == 1 else 0
+                self.numbers = pd.to_numeric(
+                        np.array(middles, dtype=np.int64), downcast='unsigned')
+
+        if self.numbers is None:
+            self.names = np.array(names, dtype=bytes)
+
+    def __repr__(self):
+        return '<ModelPaths n={0}>'.format(len(self))
+
+    def __len__(self):
+        if self.numbers is not None:
+            return len(self.numbers)
+        else:
+            return len(self.names)
+
+    def __getitem__(self, index):
+        if self.numbers is not None:
+            return '{0}{1:0{2}d}{3}'.format(
+                    self.prefix, self.numbers[index], self.width, self.suffix)
+        else:
+            return str(self.names[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, name):
+        """
+        Return the index of the given name, or None if there is no such name.
+        """
+        if self.numbers is not None:
+            middle = name[len(self.prefix):len(name) - len(self.suffix)]
+            if not middle.isdigit():
+                return None
+            matches = np.flatnonzero(self.numbers == int(middle))
+        else:
+            matches = np.flatnonzero(self.names == name)
+
+        for index in matches:
+            if self[index] == name:
+                return int(index)
+
+    def take(self, indices):
+        """
+        Return a list of the names with the given indices.
+        """
+        if self.numbers is not None:
+            format = '{0}{{0:0{1}d}}{2}'.format(
+                    self.prefix.replace('{', '{{').replace('}', '}}'),
+                    self.width,
+                    self.suffix.replace('{', '{{').replace('}', '}}')).format
+            return [format(x) for x in self.numbers[indices]]
+        else:
+            return self.names[indices].astype(str).tolist()
+
+    @property
+    def dtype(self):
+        if self.numbers is not None:
+            return self.numbers.dtype
+        else:
+            return self.names.dtype
+
+    @property
+    def nbytes(self):
+        if self.numbers is not None:
+            return self.numbers.nbytes + len(self.prefix) + len(self.suffix)
+        else:
+            return self.names.nbytes
+
+
+
+class ViewerSession(object):
+    """
+    A long-lived molecular viewer that is driven by writing commands to its
+    standard input.  Starting pymol or chimera takes several seconds, so
+    reusing one process makes it much faster to look at several models in a
+    row.  The process is (re)started whenever a command is sent and it isn't
+    running, e.g. because the user closed it.
+    """
+
+    def __init__(self, name, command, load_command, clear_command):
+        self.name = name
+        self.command = command
+        self.load_command = load_command
+        self.clear_command = clear_command
+        self.process = None
+
+    def __repr__(self):
+        return '<ViewerSession name="{0}">'.format(self.name)
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(
+                    self.command, stdin=subprocess.PIPE, stdout=devnull)
+
+    def send(self, *commands):
+        for attempt in range(2):
+            if not self.is_running():
+                self.start()
+            try:
+                for command in commands:
+                    self.process.stdin.write(command + '\n')
+                self.process.stdin.flush()
+                return
+            except IOError:
+                # The viewer was closed since we last checked; start another.
+                self.process = None
+
+    def load(self, path, replace=True):
+        """
+        Load the given model into the viewer.  If `replace` is true, any
+        models that are already loaded are closed first.  Otherwise the model
+        is overlaid on the ones already loaded.
+        """
+        commands = [self.clear_command] if replace else []
+        commands.append(self.load_command.format(path=path))
+        self.send(*commands)
+
+    def close(self):
+        if self.is_running():
+            self.process.stdin.close()
+        self.process = None
+
+
 
 def make_stock_button(stock):
     image = gtk.Image()
@@ -1366,6 +3339,133 @@ def make_operator_menu():
 default_x_metric = 'restraint_dist'
 default_y_metric = 'total_score'
 
+# Metrics that are calculated from other metrics, by name (see
+# register_derived_metric()).  Besides the metrics themselves, the expressions
+# can use any of these statistics of a metric over its whole design, e.g.
+# 'total_score_median'.
+derived_metrics = collections.OrderedDict()
+derived_metric_statistics = {
+        'median': np.nanmedian,
+        'mean': np.nanmean,
+        'std': np.nanstd,
+        'min': np.nanmin,
+        'max': np.nanmax,
+}
+
+# The functions that extract metrics from each model, by name (see
+# register_extractor()).  Only the extractors listed in `enabled_extractors` are
+# run, in that order.
+extractors = collections.OrderedDict()
+enabled_extractors = []
+
+# By default, only the lines following the coordinates in each PDB file are
+# passed to the extractors.  Set `pdb_footer_only` to False to pass every line
+# to every extractor, or register extractors that need the coordinates with
+# `footer_only=False`.  `pdb_footer_records` lists the lines that need to be
+# found before the rest of a file can be skipped.
+pdb_footer_only = True
+pdb_footer_marker = '\n#'
+pdb_footer_records = 'total_score', 'loop_backbone_rmsd', 'delta_buried_unsats'
+
+# Score files are read instead of opening every model, if the directory has any
+# (see Design._load_scored_models()).  Their columns are renamed to match the
+# metrics extracted from PDB files.  Models are matched to the rows of a score
+# file by their names, minus `pdb_extension_pattern`.  Score files and silent
+# files often call the total energy 'score', so the columns in
+# `score_file_fallback_columns` are copied from another column when a file
+# doesn't have them.
+use_score_files = True
+score_file_patterns = '*.sc',
+pdb_extension_pattern = r'\.pdb(\.gz)?$'
+score_file_columns = {
+        'loop_backbone_rmsd': 'loop_rmsd',
+}
+score_file_fallback_columns = {
+        'total_score': 'score',
+}
+
+# Designs that don't have any PDB files are read from rosetta silent files (see
+# Design._load_silent_models()).  Models are written to temporary PDB files by
+# the first of the `silent_extract_programs` that's installed when they need to
+# be viewed.
+silent_file_patterns = '*.silent', '*.out'
+silent_extract_programs = (
+        'extract_pdbs',
+        'extract_pdbs.default.linuxgccrelease',
+        'extract_pdbs.linuxgccrelease',
+        'extract_pdbs.default.macosclangrelease',
+        'extract_pdbs.macosclangrelease',
+)
+
+# The temporary PDB files extracted from silent files, see SilentIndex.
+extracted_silent_models = {}
+
+# How gzipped PDB files are decompressed: 'zlib' always decompresses them in
+# this process, 'pigz' or 'zcat' always use an external program, and 'auto' uses
+# an external program (if available) for files bigger than the threshold.
+gzip_backend = 'auto'
+external_gzip_threshold = 8 * 1024**2
+read_block_size = 1024**2
+
+# Where show_my_designs servers listen by default, and who may connect to them
+# (see server.py).  Servers also check who each client is, and only answer the
+# user running the server, so loosening the permissions doesn't let anyone
+# else in.
+default_socket_path = '/tmp/show_my_designs.sock'
+socket_permissions = 0o600
+
+# The largest messages (in bytes) that servers and clients accept.  Requests
+# are small, but responses can hold whole metric columns.
+max_request_bytes = 16 * 1024**2
+max_response_bytes = 4 * 1024**3
+
+# Whether to read caches that someone other than this user could have written.
+# Caches are pickled, and unpickling a file lets whoever wrote it run code as
+# this user.  Servers don't read such caches, because their clients can ask
+# them to load any directory.
+read_foreign_caches = True
+
+# How many PDB files are read at once by background threads.
+io_concurrency = 8
+
+# Whether to keep the metrics in memory-mapped files rather than in memory (see
+# the --out-of-core option).  The models are parsed this many at a time.  At
+# most about `max_plotted_points` models are plotted for each out-of-core (or
+# downsampled) design, always including the `num_extreme_points` most extreme
+# values of each axis.
+out_of_core = False
+out_of_core_chunk_size = 50000
+max_plotted_points = 100000
+num_extreme_points = 500
+
+# How the models in large designs are thinned out when the plot is downsampled
+# (see downsample_models()).  The fractions are of `max_plotted_points`.
+downsample_tail_fraction = 0.1
+downsample_rep_fraction = 0.05
+
+# How to start a persistent session for each viewer (see the --persistent-viewer
+# option), and the commands it understands.  Any program that reads commands
+# from stdin can be used, e.g. replace the command with ['cat'] for testing.
+viewer_commands = collections.OrderedDict([
+        ('pymol', dict(
+            command=['pymol', '-p'],
+            load_command='load "{path}"',
+            clear_command='delete all',
+        )),
+        ('chimera', dict(
+            command=['chimera', '--start', 'ReadStdin'],
+            load_command='open "{path}"',
+            clear_command='close all',
+        )),
+])
+
+# The `*.sho' scripts found in each directory, see find_sho_scripts_in().
+sho_script_cache = {}
+
+# The largest relative error that's tolerated when a metric is stored in single
+# precision to save memory.
+float32_tolerance = 1e-6
+
 metric_titles = {
         'total_score': 'Total Score (REU)',
         'loop_rmsd': u'Loop RMSD (Å)',
@@ -1379,6 +3479,90 @@ metric_guides = {
         'loop_rmsd': 1.0,
 }
 
+# The metrics and parameters used to judge how funnel-like each design is, see
+# score_funnels().  The RMSD cutoff is only used if the RMSD metric doesn't have
+# a guide.
+funnel_score_metric = 'total_score'
+funnel_rmsd_metric = 'loop_rmsd'
+funnel_rmsd_cutoff = 1.0
+funnel_num_best = 10
+funnel_kt = 1.0
+
+# How the representative of each design is picked, unless the user picked one
+# by hand: the name of a rule in `representative_rules` (see
+# register_representative_rule()).  The 'lowest_score' rule uses the
+# `representative_metric`, and the 'composite' rule adds up the standardized
+# `representative_weights` metrics.
+representative_rules = collections.OrderedDict()
+representative_rule = 'lowest_score'
+representative_metric = 'total_score'
+representative_weights = {
+        'total_score': 1.0,
+        'loop_rmsd': 1.0,
+}
+
+funnel_score_titles = collections.OrderedDict([
+        ('boltzmann_rmsd', u'Boltzmann RMSD'),
+        ('best_n_fraction', u'Best {} Near'.format(funnel_num_best)),
+        ('score_gap', u'Score Gap'),
+])
+funnel_score_directions = {
+        'boltzmann_rmsd': 'lower',
+        'best_n_fraction': 'higher',
+        'score_gap': 'higher',
+}
+
+# Held while plotting or rendering anything, and while filling the caches that
+# plotting uses (e.g. the plot masks, the Pareto fronts, and the histograms).
+# Plots for neighboring designs are rendered in a background thread, and
+# neither those caches nor matplotlib's font caches are thread-safe.
+render_lock = threading.Lock()
+
+# Where the plot is placed in the figure, with and without the marginal
+# histograms, as (left, bottom, width, height) fractions of the figure.  The
+# histograms use `num_histogram_bins` bins, which span the axis limits.
+plot_position = 0.15, 0.15, 0.75, 0.75
+plot_position_with_histograms = 0.15, 0.15, 0.65, 0.65
+x_histogram_position = 0.15, 0.81, 0.65, 0.09
+y_histogram_position = 0.81, 0.15, 0.09, 0.65
+num_histogram_bins = 60
+
+# When more than this many designs are selected, they are drawn together as a
+# single collection so that the plot stays responsive.  Pareto fronts are not
+# drawn in this mode, and the legend only names the first few designs.
+max_separate_designs = 12
+max_legend_entries = 12
+
+# Exported models are written `export_chunk_size` rows at a time, and gzipped
+# exports use the given compression level (1 is fastest, 9 is smallest).
+export_chunk_size = 100000
+export_compression_level = 6
+
+# The columns shown in the design list, as (title, type, function, direction)
+# tuples.  The function is called once for each design to get the value for
+# that column.  The type must be str, int, or float.  The direction ('lower' or
+# 'higher', whichever is better) is only used for float columns, to decide
+# where designs with missing values are sorted.
+design_list_columns = [
+        ('Name', str, lambda design: design.directory, None),
+        ('Models', int, len, None),
+        ('Min Score', float,
+            lambda design: get_metric_min(design, funnel_score_metric),
+            'lower'),
+        ('Rep RMSD', float,
+            lambda design: get_representative_metric(design, funnel_rmsd_metric),
+            'lower'),
+] + [
+        (title, float, lambda design, key=key: design.funnel_scores[key],
+            funnel_score_directions[key])
+        for key, title in funnel_score_titles.items()
+]
+
+# Whether 'lower' or 'higher' values of each metric are better.  Metrics that
+# aren't listed are assumed to be better when lower, like scores and RMSDs.
+metric_directions = {
+}
+
 metric_limits = {
         'total_score': lambda x: (
             min(x),
@@ -1403,10 +3587,28 @@ def get_metric_guide(metric, design=None):
 def get_metric_limits(metric, design=None):
     return metric_limits.get(metric, lambda x: (min(x), max(x)))
 
+def get_metric_direction(metric, design=None):
+    return metric_directions.get(metric, 'lower')
 
-def show_my_designs(directories, use_cache=True, launch_gui=True, fork_gui=True):
+
+def show_my_designs(directories, use_cache=True, launch_gui=True, fork_gui=True,
+        memory_report=False, persistent_viewer=False, socket_path=None,
+        export_path=None, export_filters=''):
     try:
-        designs = load_designs(directories, use_cache=use_cache)
+        designs = load_designs(
+                directories, use_cache=use_cache, socket_path=socket_path)
+
+        if memory_report:
+            for design in designs.values():
+                print design.get_memory_report()
+
+        if export_path is not None:
+            filters = parse_filters(export_filters)
+            num_models = export_models(
+                    export_path, designs.values(),
+                    lambda design: get_filter_mask(design, filters))
+            print "Exported {} models to '{}'".format(num_models, export_path)
+            return
 
         if designs and launch_gui:
             # If the user wants to run in a background process, try to fork.
@@ -1418,18 +3620,33 @@ def show_my_designs(directories, use_cache=True, launch_gui=True, fork_gui=True)
             except Exception:
                 pass
 
-            gui = ShowMyDesigns(designs)
+            # Let the plots for neighboring designs render in the background.
+            gobject.threads_init()
+
+            gui = ShowMyDesigns(designs, persistent_viewer)
             gtk.main()
 
     except KeyboardInterrupt:
         print
 
-def load_designs(directories, use_cache=True):
+def load_designs(directories, use_cache=True, socket_path=None):
     designs = collections.OrderedDict()
 
+    # If a server is running, let it load the designs (see server.py).
+    # Otherwise load them in this process.
+
+    client = None
+    if socket_path is not None:
+        from .server import connect
+        client = connect(socket_path)
+
     for directory in directories:
         try:
-            designs[directory] = Design(directory, use_cache)
+            if client is not None:
+                from .server import RemoteDesign
+                designs[directory] = RemoteDesign(client, directory, use_cache)
+            else:
+                designs[directory] = Design(directory, use_cache)
         except IOError as error:
             if str(error):
                 print "Error:", str(error)
@@ -1438,10 +3655,926 @@ def load_designs(directories, use_cache=True):
 
     return designs
 
-def parse_records_from_pdbs(pdb_paths):
-    records = []
+@profiler.timed('score_funnels')
+def score_funnels(designs):
+    """
+    Calculate statistics describing how funnel-like each given design is, i.e.
+    how well its lowest scoring models agree with its lowest RMSD models, and
+    return them as a data frame with one row per design:
+
+    boltzmann_rmsd:
+        The average RMSD of every model, weighted by exp(-Δscore/kT).  Lower
+        is better.
+
+    best_n_fraction:
+        The fraction of the `funnel_num_best` lowest scoring models with RMSDs
+        below the guide for the RMSD metric.  Higher is better.
+
+    score_gap:
+        The difference between the lowest score of any model with an RMSD above
+        the guide and the lowest score of any model with an RMSD below the
+        guide.  Higher is better.
+
+    All the statistics are NaN if a design doesn't have both the score and the
+    RMSD metric.  The designs are scored all at once, on their concatenated
+    metrics, so scoring lots of small designs isn't dominated by per-design
+    overhead.  Each design caches its statistics (see Design.funnel_scores),
+    so designs that have already been scored (including those scored by a
+    server) aren't scored again.
+    """
+    designs = list(designs)
+    unscored = [x for x in designs if x._funnel_scores is None]
+    scores, rmsds, cutoffs, sizes = [], [], [], []
+
+    for design in unscored:
+        design._funnel_scores = {key: np.nan for key in funnel_score_titles}
+
+        if funnel_score_metric not in design.metrics or \
+                funnel_rmsd_metric not in design.metrics:
+            continue
+
+        score = design.get_metric(funnel_score_metric).values.astype(np.float64)
+        rmsd = design.get_metric(funnel_rmsd_metric).values.astype(np.float64)
+        ok = np.isfinite(score) & np.isfinite(rmsd)
 
-    for i, path in enumerate(pdb_paths):
+        if not ok.any():
+            continue
+
+        cutoff = design.metrics[funnel_rmsd_metric].guide
+        if cutoff is None: cutoff = funnel_rmsd_cutoff
+
+        scores.append(score[ok])
+        rmsds.append(rmsd[ok])
+        cutoffs.append(cutoff)
+        sizes.append((design, np.count_nonzero(ok)))
+
+    if sizes:
+        scored, sizes = zip(*sizes)
+        sizes = np.array(sizes)
+        starts = np.cumsum(sizes) - sizes
+        groups = np.repeat(np.arange(len(sizes)), sizes)
+
+        score = np.concatenate(scores)
+        rmsd = np.concatenate(rmsds)
+        is_near = rmsd < np.repeat(cutoffs, sizes)
+
+        min_score = np.minimum.reduceat(score, starts)
+        weights = np.exp(-(score - min_score[groups]) / funnel_kt)
+        boltzmann_rmsd = \
+                np.add.reduceat(weights * rmsd, starts) / \
+                np.add.reduceat(weights, starts)
+
+        # Rank the models within each design by score, to find the best few.
+        order = np.lexsort((score, groups))
+        best = order[np.arange(len(order)) - starts[groups] < funnel_num_best]
+        best_n_fraction = np.bincount(
+                groups[best], weights=is_near[best], minlength=len(sizes)) / \
+                np.minimum(funnel_num_best, sizes)
+
+        near_min = np.minimum.reduceat(np.where(is_near, score, np.inf), starts)
+        far_min = np.minimum.reduceat(np.where(is_near, np.inf, score), starts)
+        with np.errstate(invalid='ignore'):
+            score_gap = np.where(
+                    np.isfinite(near_min) & np.isfinite(far_min),
+                    far_min - near_min, np.nan)
+
+        for i, design in enumerate(scored):
+            design._funnel_scores.update(
+                    boltzmann_rmsd=boltzmann_rmsd[i],
+                    best_n_fraction=best_n_fraction[i],
+                    score_gap=score_gap[i])
+
+    return pd.DataFrame(
+            [design.funnel_scores for design in designs],
+            index=[design.directory for design in designs],
+            columns=list(funnel_score_titles))
+
+def format_value(value):
+    if isinstance(value, (float, np.floating)):
+        return '' if not np.isfinite(value) else '{:.2f}'.format(value)
+    return str(value)
+
+def summarize_region(designs, masks, region):
+    """
+    Return the number of models from each design that are inside the given
+    (x_metric, y_metric, vertices) region and in the given mask, along with
+    the best score among them (or NaN if there are none).
+    """
+    summary = []
+
+    for design, mask in zip(designs, masks):
+        inside = design.get_region_mask(*region) & mask
+        num_inside = np.count_nonzero(inside)
+        metric = funnel_score_metric \
+                if funnel_score_metric in design.metrics else region[1]
+        scores = np.asarray(design.get_metric(metric))[inside]
+
+        if not num_inside:
+            best = np.nan
+        elif design.metrics[metric].direction == 'higher':
+            best = np.nanmax(scores)
+        else:
+            best = np.nanmin(scores)
+
+        summary.append((num_inside, best))
+
+    return summary
+
+def get_metric_min(design, metric):
+    if metric not in design.metrics:
+        return np.nan
+    return design.get_metric(metric).min()
+
+def get_representative_metric(design, metric):
+    if metric not in design.metrics:
+        return np.nan
+    return design.get_metric(metric)[design.representative]
+
+def find_pareto_front(x, y):
+    """
+    Return a boolean mask of the points that are not dominated by any other
+    point, assuming that lower values are better for both x and y.  The points
+    are sorted by x, so a point is on the front if its y is lower than that of
+    every point before it.  This takes O(n log n) time.
+
+    Points that are NaN or infinite in either metric are never on the front.
+    Identical points are either all on the front or all off it.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    front = np.zeros(len(x), dtype=bool)
+
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if not len(finite):
+        return front
+
+    order = finite[np.lexsort((y[finite], x[finite]))]
+    sorted_x, sorted_y = x[order], y[order]
+
+    best_y_so_far = np.minimum.accumulate(sorted_y)
+    best_y_before = np.concatenate([[np.inf], best_y_so_far[:-1]])
+
+    # Identical points are next to each other once sorted.  Only the first of
+    # each group is compared to the points before it, and the rest follow it.
+
+    is_first = np.concatenate([[True],
+        (sorted_x[1:] != sorted_x[:-1]) | (sorted_y[1:] != sorted_y[:-1])])
+    group = np.cumsum(is_first) - 1
+    is_first_on_front = (sorted_y < best_y_before)[is_first]
+
+    front[order] = is_first_on_front[group]
+    return front
+
+def load_cache(cache_path):
+    """
+    Return a dictionary mapping the name of each extractor to its version and
+    the columns it extracted, the model names, and the (size, mtime) of each
+    model file from the given cache, or None if the cache can't be trusted
+    (see `read_cache()`).
+    """
+    cache = read_cache(cache_path)
+
+    if cache is None:
+        return None
+
+    # Caches written by older versions of this program are a single data
+    # frame with the model names in the 'path' column, and don't record any
+    # file stats.  Assume that they're up to date.  Caches written before
+    # there were extractors only have columns from the 'scores' extractor.
+
+    if isinstance(cache, pd.DataFrame):
+        paths = ModelPaths(cache.pop('path') if 'path' in cache else [])
+        return {'scores': (1, compact_models(cache))}, paths, [None] * len(paths)
+
+    stats = cache.get('stats')
+    stats = zip(stats['size'], stats['mtime']) \
+            if stats is not None else [None] * len(cache['paths'])
+
+    if 'extractors' in cache:
+        columns = {
+                k: (v['version'], v['models'])
+                for k, v in cache['extractors'].items()}
+    else:
+        columns = {'scores': (1, cache['models'])}
+
+    if len(stats) != len(cache['paths']) or any(
+            len(x) != len(stats) for version, x in columns.values()):
+        raise ValueError("inconsistent number of models")
+
+    return columns, cache['paths'], stats
+
+def read_cache(cache_path):
+    """
+    Unpickle the given cache, or return None if `read_foreign_caches` is false
+    and someone other than this user could have written it.  The owner and the
+    permissions are checked on the open file, so the file can't be swapped for
+    a different one after it's been checked.
+    """
+    with open(cache_path, 'rb') as file:
+        if not read_foreign_caches:
+            stat = os.fstat(file.fileno())
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+                return None
+
+        return pd.read_pickle(file, compression=None)
+
+def save_cache(cache_path, columns, paths, stats):
+    """
+    Write the given columns (a dictionary mapping the name of each extractor
+    to its version and the columns it extracted) to the cache, unless another
+    process is already writing it.  The cache is replaced atomically, so
+    readers always see either the old or the new cache in full.
+    """
+    sizes, mtimes = zip(*stats) if stats else ((), ())
+    stats = {
+            'size': np.array(sizes, dtype=np.int64),
+            'mtime': np.array(mtimes, dtype=np.float64),
+    }
+    extractors = {
+            k: {'version': version, 'models': models}
+            for k, (version, models) in columns.items()}
+    cache = {'extractors': extractors, 'paths': paths, 'stats': stats}
+
+    with cache_lock(cache_path) as is_locked:
+        if is_locked:
+            replace_atomically(cache_path, lambda x: pd.to_pickle(cache, x))
+
+@contextlib.contextmanager
+def cache_lock(cache_path):
+    """
+    Try to take an advisory lock on the given cache, without waiting.  Yield
+    True if the lock was taken, or False if another process holds it (or the
+    lock can't be taken at all), in which case the cache shouldn't be written.
+    Only writers take this lock, so readers never wait for writers.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+
+    try:
+        file = open(cache_path + '.lock', 'a')
+    except IOError:
+        yield False
+        return
+
+    with file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as error:
+            if error.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            is_locked = False
+        else:
+            is_locked = True
+
+        try:
+            yield is_locked
+        finally:
+            if is_locked:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+def get_umask():
+    return process_umask
+
+def replace_atomically(path, write):
+    """
+    Call `write()` with the path to a temporary file in the same directory as
+    the given path, then rename the temporary file to the given path.
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(
+            dir=directory or '.', prefix='.' + name + '.', suffix='.tmp')
+    os.close(fd)
+
+    # mkstemp() makes files that only the owner can read, but caches should
+    # be as readable as any other file the user creates.
+    os.chmod(temp_path, 0o666 & ~get_umask())
+
+    try:
+        write(temp_path)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+def scan_pdb_directory(directory):
+    """
+    List the given directory once, and return a dictionary mapping the name of
+    each PDB file to its (size, mtime), the total number of entries in the
+    directory, and similar dictionaries for the score files and the silent
+    files.  os.scandir() (or the scandir backport) is used when
+    available, because on network file systems it can get the file stats
+    along with the directory listing.
+    """
+    from fnmatch import fnmatch
+
+    stats = collections.OrderedDict()
+    score_stats = collections.OrderedDict()
+    silent_stats = collections.OrderedDict()
+    num_entries = 0
+
+    def is_score_file(name): #
+        return any(fnmatch(name, x) for x in score_file_patterns)
+
+    def is_silent_file(name): #
+        return any(fnmatch(name, x) for x in silent_file_patterns)
+
+    if scandir is not None:
+        for entry in scandir(directory):
+            num_entries += 1
+            if fnmatch(entry.name, '*.pdb*') and entry.is_file():
+                stat = entry.stat()
+                stats[entry.name] = stat.st_size, stat.st_mtime
+            elif is_score_file(entry.name) and entry.is_file():
+                stat = entry.stat()
+                score_stats[entry.name] = stat.st_size, stat.st_mtime
+            elif is_silent_file(entry.name) and entry.is_file():
+                stat = entry.stat()
+                silent_stats[entry.name] = stat.st_size, stat.st_mtime
+    else:
+        for name in os.listdir(directory):
+            num_entries += 1
+            path = os.path.join(directory, name)
+            if fnmatch(name, '*.pdb*') and os.path.isfile(path):
+                stat = os.stat(path)
+                stats[name] = stat.st_size, stat.st_mtime
+            elif is_score_file(name) and os.path.isfile(path):
+                stat = os.stat(path)
+                score_stats[name] = stat.st_size, stat.st_mtime
+            elif is_silent_file(name) and os.path.isfile(path):
+                stat = os.stat(path)
+                silent_stats[name] = stat.st_size, stat.st_mtime
+
+    return stats, num_entries, score_stats, silent_stats
+
+def read_score_file(path):
+    """
+    Return a data frame with a row for each model in the given rosetta score
+    file, indexed by the name of the model (without the '.pdb' extension).
+    The whole file is parsed by pandas' C parser in a single read.  If a model
+    was scored more than once, its last scores are used.
+    """
+    # Rosetta starts score files with a 'SEQUENCE:' line.  The header is the
+    # first line that starts with 'SCORE:', and it ends with the description
+    # (i.e. the name) of each model.
+
+    with open(path) as file:
+        for num_skipped, line in enumerate(file):
+            if line.startswith('SCORE:'):
+                break
+        else:
+            return pd.DataFrame()
+
+    return parse_score_table(path, path, num_skipped)
+
+def parse_score_table(source, path, num_skipped=0):
+    """
+    Parse the SCORE lines (starting with the header) from the given path or
+    file-like object, as described in read_score_file().  The path is only
+    used in error messages.
+    """
+    # Lines with more columns than the header (e.g. from a job that used a
+    # different score function) are skipped.
+
+    table = pd.read_csv(
+            source, delim_whitespace=True, skiprows=num_skipped, engine='c',
+            error_bad_lines=False, warn_bad_lines=False)
+
+    if 'description' not in table:
+        raise IOError("'{}' doesn't have a 'description' column".format(path))
+
+    # Jobs that write to the same score file each repeat the header.  Those
+    # lines make pandas read every column as strings, so they have to be
+    # dropped and the columns converted back into numbers.
+
+    names = table.pop('description').astype(str)
+    is_score = (table.pop('SCORE:') == 'SCORE:') if 'SCORE:' in table \
+            else pd.Series(True, index=table.index)
+    is_score &= (names != 'description')
+
+    if not is_score.all():
+        table, names = table[is_score.values], names[is_score.values]
+
+    for column in table:
+        if table[column].dtype.kind not in 'biuf':
+            table[column] = pd.to_numeric(table[column], errors='coerce')
+
+    table = table.dropna(axis=1, how='all')
+    table = add_fallback_columns(table.rename(columns=score_file_columns))
+    table.index = names.str.replace(pdb_extension_pattern, '')
+    return table[~table.index.duplicated(keep='last')]
+
+def add_fallback_columns(table):
+    """
+    Copy the columns in `score_file_fallback_columns` that the given table
+    doesn't have from the ones they fall back on, e.g. 'total_score' from
+    'score'.
+    """
+    for column, fallback in score_file_fallback_columns.items():
+        if column not in table and fallback in table:
+            table[column] = table[fallback]
+    return table
+
+def strip_pdb_extension(name):
+    return re.sub(pdb_extension_pattern, '', name)
+
+def is_silent_file(path):
+    try:
+        with open(path) as file:
+            return file.read(9) == 'SEQUENCE:'
+    except IOError:
+        return False
+
+def index_silent_file(path):
+    """
+    Scan the given silent file once, and return its header (everything before
+    the first model), its SCORE header, the SCORE line of each model, and the
+    offsets where each model's block starts and ends.  The file is memory-
+    mapped and searched for SCORE lines, so the coordinates are never split
+    into lines.
+    """
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return '', '', [], [], []
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        score_header = None
+        score_lines, starts, ends = [], [], []
+
+        for start in find_lines(data, 'SCORE:'):
+            line = data[start:data.find('\n', start)].rstrip()
+
+            # Jobs that append to the same silent file each repeat the header,
+            # and each header ends the block of the model before it.
+
+            if line.split()[-1] == 'description':
+                if score_header is None:
+                    score_header = line
+                if starts and len(ends) < len(starts):
+                    sequence = data.rfind('\nSEQUENCE:', starts[-1], start)
+                    ends.append(sequence + 1 if sequence >= 0 else start)
+                continue
+
+            if len(ends) < len(starts):
+                ends.append(start)
+
+            score_lines.append(line)
+            starts.append(start)
+
+        if len(ends) < len(starts):
+            ends.append(len(data))
+
+        if score_header is None:
+            raise IOError("'{}' doesn't have a SCORE header".format(path))
+
+        header = data[:starts[0]] if starts else ''
+        return header, score_header, score_lines, starts, ends
+
+    finally:
+        data.close()
+
+def find_lines(data, prefix):
+    """
+    Yield the offset of every line in the given string (or memory map) that
+    starts with the given prefix.
+    """
+    if data[:len(prefix)] == prefix:
+        yield 0
+
+    marker = '\n' + prefix
+    i = data.find(marker)
+
+    while i >= 0:
+        yield i + 1
+        i = data.find(marker, i + 1)
+
+def extract_silent_model(silent):
+    """
+    Turn the given single-model silent file into a PDB file using rosetta's
+    extract_pdbs program, and return the path to the PDB file.  The files are
+    written to a temporary directory that's removed when the program exits.
+    """
+    from distutils.spawn import find_executable
+
+    programs = [x for x in silent_extract_programs if find_executable(x)]
+    if not programs:
+        raise IOError("can't extract models from silent files without one "
+                "of: " + ', '.join(silent_extract_programs))
+
+    directory = tempfile.mkdtemp(prefix='show_my_designs.')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+
+    silent_path = os.path.join(directory, 'model.silent')
+    with open(silent_path, 'wb') as file:
+        file.write(silent)
+
+    with open(os.devnull, 'w') as devnull:
+        status = subprocess.call(
+                [programs[0], '-in:file:silent', silent_path],
+                cwd=directory, stdout=devnull, stderr=devnull)
+
+    pdb_paths = glob.glob(os.path.join(directory, '*.pdb'))
+
+    if status != 0 or not pdb_paths:
+        raise IOError("'{}' failed to extract a model from '{}'".format(
+            programs[0], silent_path))
+
+    return pdb_paths[0]
+
+def prefetch(function, items, concurrency=None):
+    """
+    Call the given function on each item in background threads, keeping up to
+    `concurrency` calls in flight.  Yield each item along with a callable that
+    returns the result of the function for that item (or raises whatever
+    exception the function raised), in the same order as the items.  This is
+    meant for I/O bound functions, where the threads can wait on the file
+    system in parallel.
+    """
+    if concurrency is None:
+        concurrency = io_concurrency
+
+    # Starting threads isn't free, so don't bother for just a few items.
+    items = list(items)
+
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            yield item, functools.partial(function, item)
+        return
+
+    import threading, Queue
+
+    jobs = Queue.Queue()
+    pending = collections.deque()
+    num_threads = min(concurrency, len(items))
+    items = iter(items)
+
+    def work(): #
+        for item, result in iter(jobs.get, None):
+            try: result.put((function(item), None))
+            except Exception as error: result.put((None, error))
+
+    def submit(num_items): #
+        for item in itertools.islice(items, num_items):
+            result = Queue.Queue(1)
+            jobs.put((item, result))
+            pending.append((item, result))
+
+    def get_result(result): #
+        value, error = result.get()
+        if error is not None: raise error
+        return value
+
+    for i in range(num_threads):
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+
+    try:
+        submit(2 * concurrency)
+        while pending:
+            item, result = pending.popleft()
+            submit(1)
+            yield item, functools.partial(get_result, result)
+    finally:
+        for i in range(num_threads):
+            jobs.put(None)
+
+def compact_models(models):
+    """
+    Store each metric in the smallest dtype that can hold it.  Metrics that
+    only have integer values (e.g. buried unsatisfied H-bond counts) become
+    small integers, and metrics that can be represented in single precision
+    without losing more than ~6 significant figures become float32.
+    """
+    compact = pd.DataFrame(index=models.index)
+
+    for column in models:
+        values = models[column]
+
+        if values.dtype.kind == 'f' and values.notnull().all() \
+                and (values == values.round()).all():
+            values = pd.to_numeric(values, downcast='integer')
+
+        elif values.dtype.kind == 'f' and values.dtype != np.float32:
+            single = values.astype(np.float32)
+            if np.allclose(single, values, rtol=float32_tolerance, atol=0,
+                    equal_nan=True):
+                values = single
+
+        elif values.dtype.kind in 'iu':
+            values = pd.to_numeric(values, downcast='integer')
+
+        compact[column] = values
+
+    return compact
+
+def downsample_models(design, x_metric, y_metric, max_points):
+    """
+    Return a boolean mask of about `max_points` models to plot for the given
+    design.  Random subsampling would lose the low-scoring models that matter
+    most, so instead:
+
+    - The best scoring models (`downsample_tail_fraction` of the points) are
+      always kept, as are the models closest to the representative on the
+      plotted axes (`downsample_rep_fraction` of the points).
+
+    - The models with the most extreme values on either axis are kept, so the
+      axis limits don't change.
+
+    - The rest of the points are spread evenly over the remaining models in
+      order of score, so every part of the score distribution is thinned by
+      the same amount.
+    """
+    def get_badness(metric): #
+        values = np.asarray(design.get_metric(metric), dtype=np.float64)
+        if design.metrics[metric].direction == 'higher':
+            values = -values
+        return np.where(np.isnan(values), np.inf, values)
+
+    score_metric = funnel_score_metric \
+            if funnel_score_metric in design.metrics else y_metric
+    score = get_badness(score_metric)
+    mask = np.zeros(len(design), dtype=bool)
+
+    # Keep the best scoring models.
+    num_best = int(downsample_tail_fraction * max_points)
+    if num_best:
+        mask[np.argpartition(score, num_best)[:num_best]] = True
+
+    # Keep the models near the representative.  Each axis is scaled by its
+    # spread, so that "near" means the same thing in both directions.
+    num_near = int(downsample_rep_fraction * max_points)
+    if num_near:
+        rep = design.representative
+        distance = np.zeros(len(design))
+        for metric in (x_metric, y_metric):
+            values = np.asarray(design.get_metric(metric), dtype=np.float64)
+            spread = np.nanstd(values) or 1
+            distance += ((values - values[rep]) / spread)**2
+        distance[np.isnan(distance)] = np.inf
+        mask[np.argpartition(distance, num_near)[:num_near]] = True
+
+    # Keep the extreme values.
+    for metric in set([x_metric, y_metric]):
+        values = design.get_metric(metric).values
+        mask[find_extremes(values, num_extreme_points)] = True
+
+    # Thin out everything else evenly, in order of score.
+    remaining = np.flatnonzero(~mask)
+    budget = min(max_points - np.count_nonzero(mask), len(remaining))
+    if budget > 0:
+        remaining = remaining[np.argsort(score[remaining], kind='mergesort')]
+        mask[remaining[np.linspace(0, len(remaining) - 1, budget).astype(int)]] = True
+
+    return mask
+
+def find_extremes(values, num):
+    """
+    Return the indices of the `num` lowest and `num` highest values in the
+    given array, ignoring NaN.  The array is read one chunk at a time, so it
+    can be memory-mapped without all being read into memory.
+    """
+    def select(values): #
+        if len(values) <= 2 * num:
+            return np.arange(len(values))
+        return np.concatenate([
+                np.argpartition(values, num)[:num],
+                np.argpartition(values, -num)[-num:]])
+
+    candidates = [np.array([], dtype=int)]
+
+    for start in range(0, len(values), out_of_core_chunk_size):
+        chunk = np.asarray(
+                values[start:start + out_of_core_chunk_size], dtype=np.float64)
+        finite = np.flatnonzero(~np.isnan(chunk))
+        candidates.append(start + finite[select(chunk[finite])])
+
+    candidates = np.concatenate(candidates)
+    return candidates[select(np.asarray(values[candidates], dtype=np.float64))]
+
+def apply_filter(values, operator, threshold):
+    """
+    Return a boolean mask of the given values that pass the given comparison
+    with the threshold, e.g. `apply_filter(scores, '<', -300)`.
+    """
+    values = np.asarray(values)
+
+    if operator == '>': return values > threshold
+    if operator == '<': return values < threshold
+    if operator == '>=': return values >= threshold
+    if operator == '<=': return values <= threshold
+    if operator in ('=', '=='): return values == threshold
+    if operator == '!=': return values != threshold
+
+    raise ValueError("unknown filter operator '{}'".format(operator))
+
+def parse_filters(spec):
+    """
+    Parse a comma-separated list of filters (e.g. 'total_score<-300,
+    loop_rmsd<=2') into (name, operator, threshold) tuples.
+    """
+    filters = []
+
+    for filter in spec.split(','):
+        if not filter.strip():
+            continue
+
+        match = re.match(r'^\s*(\S+?)\s*(<=|>=|==|!=|<|>|=)\s*(\S+)\s*$', filter)
+        if not match:
+            raise ValueError("can't parse filter '{}'".format(filter.strip()))
+
+        name, operator, threshold = match.groups()
+        filters.append((name, operator, float(threshold)))
+
+    return filters
+
+def get_filter_mask(design, filters):
+    """
+    Return a boolean mask of the models in the given design that pass every
+    given (name, operator, threshold) filter.
+    """
+    return design.apply_filters(filters)[0]
+
+def export_models(path, designs, get_mask=None, columns=None):
+    """
+    Write the metrics for the models in the given designs to a CSV file, one
+    model per row, and return the number of models written.
+
+    Only the models in the mask returned by `get_mask(design)` are written, if
+    that function is given.  The rows are written one design (and at most
+    `export_chunk_size` models) at a time, so the whole table is never in
+    memory at once.  The file is tab-separated if its name ends in '.tsv' (or
+    '.tsv.gz'), and gzipped if its name ends in '.gz'.  The columns are the
+    given metrics, or else every metric in any of the designs.  Designs without
+    some metric have empty cells in that column.  If any of the designs are
+    stored in silent files, the 'path' column has the path to the silent file
+    and a 'tag' column has the tag of the model in that file.
+    """
+    designs = list(designs)
+
+    if columns is None:
+        columns = sorted(set(itertools.chain(*(x.metrics for x in designs))))
+
+    separator = '\t' if re.search(r'\.tsv(\.gz)?$', path) else ','
+    has_tags = any(x.is_silent for x in designs)
+
+    def write(file): #
+        num_models = 0
+        header = ['design', 'path'] + (['tag'] if has_tags else [])
+        pd.DataFrame(columns=header + list(columns)).to_csv(
+                file, sep=separator, index=False)
+
+        for design in designs:
+            if get_mask is not None:
+                indices = np.flatnonzero(get_mask(design))
+            else:
+                indices = np.arange(len(design))
+
+            for start in range(0, len(indices), export_chunk_size):
+                chunk = indices[start:start + export_chunk_size]
+                rows = collections.OrderedDict()
+                rows['design'] = np.repeat(design.directory, len(chunk))
+                rows['path'], tags = design.get_model_locations(chunk)
+                if has_tags:
+                    rows['tag'] = tags
+
+                for column in columns:
+                    if column in design.metrics:
+                        rows[column] = np.asarray(design.get_metric(column))[chunk]
+                    else:
+                        rows[column] = np.repeat(np.nan, len(chunk))
+
+                pd.DataFrame(rows).to_csv(
+                        file, sep=separator, header=False, index=False)
+
+            num_models += len(indices)
+
+        return num_models
+
+    if path.endswith('.gz'):
+        with gzip.open(path, 'wb', export_compression_level) as file:
+            return write(file)
+    else:
+        with open(path, 'wb') as file:
+            return write(file)
+
+def format_model_locations(paths, tags):
+    """
+    Return a line for each of the given models, as returned by
+    `Design.get_model_locations()`.  Models from silent files are written as
+    the path to the silent file and the tag, separated by a space.
+    """
+    return [
+            path + '\n' if tag is None else '{} {}\n'.format(path, tag)
+            for path, tag in zip(paths, tags)]
+
+def format_bytes(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(num_bytes) < 1024 or unit == 'GB':
+            break
+        num_bytes /= 1024.0
+    return '{:.1f} {}'.format(num_bytes, unit)
+
+def register_derived_metric(name, expression):
+    """
+    Define a metric that's calculated from other metrics by the given numexpr
+    expression, e.g. `register_derived_metric('score_per_residue',
+    'total_score / num_residues')`.  The metric is added to every design that
+    has all the metrics the expression uses, and is calculated the first time
+    it's used.  Set the title, direction, etc. of the metric like for any
+    other metric, e.g. with `metric_titles`.
+    """
+    try:
+        variables, _ = numexpr.necompiler.getExprNames(expression, {})
+    except (SyntaxError, KeyError, TypeError) as error:
+        raise ValueError("can't parse expression for '{}' ({}): {}".format(
+            name, error, expression))
+
+    derived_metrics[name] = DerivedMetric(name, expression, variables)
+
+def parse_derived_metrics(spec):
+    """
+    Register the derived metrics defined by the given semicolon-separated
+    'name=expression' pairs.
+    """
+    for definition in spec.split(';'):
+        if not definition.strip():
+            continue
+
+        match = re.match(r'^\s*(\w+)\s*=(?!=)(.+)$', definition)
+        if not match:
+            raise ValueError("can't parse derived metric '{}'".format(
+                definition.strip()))
+
+        register_derived_metric(match.group(1), match.group(2).strip())
+
+def register_extractor(name, version=1, footer_only=True, enabled=True):
+    """
+    Decorate a function that extracts metrics from a single model.  The
+    function is called with a record (a dictionary to add the metrics to), the
+    path to the model, and the lines of the model (only the ones following the
+    coordinates, if `footer_only` is true).
+
+    The columns made by each extractor are cached separately, so increment
+    `version` whenever the function changes: only its columns will be
+    extracted again.  Registering an extractor with an existing name replaces
+    the old one.  Extractors that aren't enabled can be turned on later by
+    adding their names to `enabled_extractors`.
+    """
+    def decorator(function): #
+        extractors[name] = Extractor(name, version, function, footer_only)
+        if enabled and name not in enabled_extractors:
+            enabled_extractors.append(name)
+        return function
+    return decorator
+
+def get_enabled_extractors():
+    return [extractors[x] for x in enabled_extractors]
+
+def merge_extractor_columns(frames):
+    """
+    Combine the columns extracted by several extractors (for the same models,
+    in the same order) into a single data frame.  If two extractors produce
+    the same metric, the one that runs last wins.
+    """
+    frames = [x for x in frames if len(x.columns)]
+    if not frames:
+        return pd.DataFrame()
+
+    models = pd.concat(frames, axis=1)
+    return models.loc[:, ~models.columns.duplicated(keep='last')]
+
+@profiler.timed('parse_records_from_pdbs')
+def parse_records_from_pdbs(pdb_paths):
+    """
+    Return a {'metric': value} dictionary for each of the given models, with
+    the name of the model under 'path', using every enabled extractor.
+    """
+    records = extract_records(pdb_paths, get_enabled_extractors())
+    return merge_extractor_columns(records.values()).to_dict('records')
+
+@profiler.timed('extract_records')
+def extract_records(pdb_paths, extractors):
+    """
+    Run the given extractors on each of the given models.  Each file is read
+    only once, by background threads, no matter how many extractors use it.
+    Return a dictionary mapping the name of each extractor to a data frame
+    with a 'path' column and a column for each metric it found.  Models that
+    can't be read are left out.
+    """
+    footer_only = None if all(x.footer_only for x in extractors) else False
+    read_lines = functools.partial(read_pdb_lines, footer_only=footer_only)
+    records = collections.OrderedDict((x.name, []) for x in extractors)
+
+    if not extractors:
+        return records
+
+    pdb_reader = prefetch(read_lines, pdb_paths)
+
+    for i, (path, get_lines) in enumerate(pdb_reader):
 
         # Update the user on our progress, because this is often slow.
 
@@ -1449,29 +4582,162 @@ def parse_records_from_pdbs(pdb_paths):
             os.path.dirname(path), i+1, len(pdb_paths)))
         sys.stdout.flush()
 
-        # Read the PDB file, which we are assuming is gzipped.
+        # Read the PDB file, which may or may not be gzipped.  Usually only the
+        # score footer is read, see read_pdb_lines().  The files are read ahead
+        # in background threads, so this usually doesn't have to wait.
 
         try:
-            def smart_open(path): #
-                if path.endswith('.gz'): return gzip.open(path)
-                else: return open(path)
-
-            with smart_open(path) as file:
-                lines = file.readlines()
+            with profiler.section('extract_records: read'):
+                lines = get_lines()
 
         except IOError:
             print "\nFailed to read '{}'".format(path)
             continue
 
-        # Parse the pdb file.  This method may be overloaded to parse
-        # different kinds of information.
+        # Give each extractor its own record, so the columns it finds can be
+        # cached separately.
 
-        record = {'path': os.path.basename(path)}
-        parse_record_from_pdb(record, path, lines)
-        records.append(record)
+        name = os.path.basename(path)
+
+        for extractor in extractors:
+            record = {'path': name}
+            with profiler.section('extract_records: ' + extractor.name):
+                extractor.function(record, path, lines)
+            records[extractor.name].append(record)
 
     if pdb_paths: print
-    return records
+    return collections.OrderedDict(
+            (k, pd.DataFrame(v)) for k, v in records.items())
+
+def read_pdb_lines(path, footer_only=None):
+    """
+    Return the lines of the given (possibly gzipped) PDB file that are needed
+    by the extractors.
+
+    The file is decompressed in large blocks and, if `footer_only` is true
+    (the default is `pdb_footer_only`), the coordinates are skipped by
+    scanning the raw bytes for the first line beginning with '#', which is
+    where rosetta starts writing scores.  Only the lines from that point on
+    are split and returned, and reading stops as soon as every line in
+    `pdb_footer_records` has been seen.  Files without such a line (e.g. ones
+    that keep their scores in REMARK records) are returned whole.
+    """
+    if footer_only is None:
+        footer_only = pdb_footer_only
+
+    blocks = iter_pdb_blocks(path)
+
+    if not footer_only:
+        return ''.join(blocks).splitlines(True)
+
+    # Pretend the file starts with a newline, so a footer on the very first
+    # line is found like any other.  Each block is searched together with the
+    # end of the previous one, in case the marker straddles the two.  The
+    # blocks read before the footer is found are kept, so the whole file can
+    # be returned if it turns out not to have one.
+
+    buffer = '\n'
+    footer = None
+    skipped = []
+
+    try:
+        for block in blocks:
+            if footer is None:
+                skipped.append(block)
+                buffer = buffer[1 - len(pdb_footer_marker):] + block
+                start = buffer.find(pdb_footer_marker)
+                if start < 0:
+                    continue
+                footer = buffer[start + 1:]
+                skipped = None
+            else:
+                footer += block
+
+            # Stop as soon as all the records we need have been seen, taking
+            # care not to stop in the middle of a line.
+
+            complete = '\n' + footer[:footer.rfind('\n') + 1]
+            if pdb_footer_records and all(
+                    '\n' + x in complete for x in pdb_footer_records):
+                return complete[1:].splitlines(True)
+    finally:
+        blocks.close()
+
+    if footer is None:
+        return ''.join(skipped).splitlines(True)
+
+    return footer.splitlines(True)
+
+def iter_pdb_blocks(path):
+    """
+    Yield the contents of the given PDB file in large blocks, decompressing it
+    on the fly if necessary.  Large gzipped files are decompressed by an
+    external `pigz` or `zcat` process if one is available (see
+    `gzip_backend`), because that runs in parallel with the parsing.
+    """
+    if not path.endswith('.gz'):
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(read_block_size), ''):
+                yield block
+        return
+
+    command = find_gzip_command(path)
+
+    if command:
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(
+                    command + [path], stdout=subprocess.PIPE, stderr=devnull)
+            try:
+                for block in iter(
+                        lambda: process.stdout.read(read_block_size), ''):
+                    yield block
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                process.stdout.close()
+                status = process.wait()
+
+        if status not in (0, -signal.SIGKILL):
+            raise IOError("'{}' failed to decompress '{}'".format(
+                command[0], path))
+        return
+
+    with open(path, 'rb') as file:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        try:
+            for block in iter(lambda: file.read(read_block_size), ''):
+                # Files made by concatenating several gzip files contain
+                # several members, each of which needs a new decompressor.
+                while block:
+                    yield decompressor.decompress(block)
+                    block = decompressor.unused_data
+                    if block:
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+            yield decompressor.flush()
+
+        except zlib.error as error:
+            raise IOError("'{}' is not a valid gzip file: {}".format(path, error))
+
+def find_gzip_command(path):
+    from distutils.spawn import find_executable
+
+    if gzip_backend == 'zlib':
+        return None
+
+    if gzip_backend == 'auto':
+        try:
+            if os.path.getsize(path) < external_gzip_threshold:
+                return None
+        except OSError:
+            return None
+
+    for name in ('pigz', 'zcat'):
+        if gzip_backend in ('auto', name) and find_executable(name):
+            return [name, '-dc'] if name == 'pigz' else [name]
+
+    return None
 
 def parse_record_from_pdb(record, pdb_path, lines):
     # Get different information from different lines in the PDB file.  Some
@@ -1490,20 +4756,148 @@ def parse_record_from_pdb(record, pdb_path, lines):
         if line.startswith('delta_buried_unsats'):
             record['delta_buried_unsats'] = float(line.split()[1])
 
+@register_extractor('scores')
+def extract_scores(record, pdb_path, lines):
+    # parse_record_from_pdb() is looked up every time, so scripts that replace
+    # it (which is how metrics were added before there were extractors) still
+    # work.
+    parse_record_from_pdb(record, pdb_path, lines)
+
+@register_extractor('energy_terms', enabled=False)
+def extract_energy_terms(record, pdb_path, lines):
+    """
+    Add a metric for each weighted score term (e.g. 'fa_atr') in the energy
+    table that rosetta writes after the coordinates.  Not enabled by default,
+    because most score functions have a few dozen terms.
+    """
+    labels = None
+
+    for line in lines:
+        if line.startswith('label '):
+            labels = line.split()[1:]
+
+        elif line.startswith('pose ') and labels:
+            for label, value in zip(labels, line.split()[1:]):
+                if label != 'total':
+                    record[label] = float(value)
+            return
+
+def register_representative_rule(name, incremental=False):
+    """
+    Decorate a function that picks the representative of a design.  The
+    function is called with the design and an array of candidate indices, and
+    should return the index of the best candidate.
+
+    Rules are usually given every model in the design.  If a rule is
+    `incremental` (i.e. whether one model is better than another doesn't
+    depend on the other models), then after models are added to a design, it
+    is only given the new models and the old representative.
+    """
+    def decorator(function): #
+        representative_rules[name] = RepresentativeRule(
+                name, function, incremental)
+        return function
+    return decorator
+
+@register_representative_rule('lowest_score', incremental=True)
+def find_lowest_scoring_model(design, indices):
+    scores = np.asarray(design.get_metric(representative_metric))
+    return indices[np.nanargmin(scores[indices])]
+
+@register_representative_rule('composite')
+def find_best_composite_model(design, indices):
+    """
+    Pick the model with the best sum of the `representative_weights` metrics,
+    each scaled to have unit variance and oriented so that lower is better.
+    """
+    total = np.zeros(len(indices))
+
+    for metric, weight in representative_weights.items():
+        if metric not in design.metrics:
+            continue
+        values = np.asarray(design.get_metric(metric), dtype=float)[indices]
+        values = (values - np.nanmean(values)) / (np.nanstd(values) or 1)
+        if design.metrics[metric].direction == 'higher':
+            values = -values
+        total += weight * np.nan_to_num(values)
+
+    return indices[np.argmin(total)]
+
+@register_representative_rule('pareto')
+def find_pareto_knee_model(design, indices):
+    """
+    Pick the model on the Pareto front of the funnel RMSD and score metrics
+    that's closest to the ideal corner of the plot, with both metrics scaled
+    to span the front.
+    """
+    front = np.intersect1d(indices, np.flatnonzero(
+            design.get_pareto_front(funnel_rmsd_metric, funnel_score_metric)))
+    distances = np.zeros(len(front))
+
+    for metric in funnel_rmsd_metric, funnel_score_metric:
+        values = np.asarray(design.get_metric(metric), dtype=float)[front]
+        if design.metrics[metric].direction == 'higher':
+            values = -values
+        span = np.ptp(values) or 1
+        distances += ((values - np.min(values)) / span)**2
+
+    return front[np.argmin(distances)]
+
+def find_sho_scripts(directory):
+    """
+    Search for scripts that can perform some action using a model from the
+    given directory.  Such scripts must have the `*.sho' suffix and may be
+    located anywhere from the directory containing the models to any directory
+    below that.  If selected, the script will be called with sh as the
+    interpreter and the path to the model as the singular argument.
+    """
+    directory = os.path.abspath(directory)
+    sho_scripts = []
+
+    while directory != os.path.abspath('/'):
+        sho_scripts += find_sho_scripts_in(directory)
+        directory = os.path.dirname(directory)
+
+    return sho_scripts
+
+def find_sho_scripts_in(directory):
+    """
+    Return the `*.sho' scripts in the given directory (but not its parents).
+    The results are cached until the modification time of the directory
+    changes, which happens whenever a file is added to or removed from it.
+    Most designs share parent directories, so most of these lookups are
+    shared too.
+    """
+    try:
+        mtime = os.stat(directory).st_mtime
+    except OSError:
+        return []
+
+    cached_mtime, scripts = sho_script_cache.get(directory, (None, None))
+
+    if scripts is None or mtime != cached_mtime:
+        scripts = sorted(glob.glob(os.path.join(directory, '*.sho')))
+        sho_script_cache[directory] = mtime, scripts
+
+    return scripts
+
 def try_to_run_command(command):
     with open(os.devnull, 'w') as devnull:
         try: subprocess.Popen(command, stdout=devnull)
         except OSError as error:
-            message = gtk.MessageDialog(
-                    parent=None,
-                    flags=0,
-                    type=gtk.MESSAGE_ERROR,
-                    buttons=gtk.BUTTONS_OK,
-            )
-            message.set_markup("<b>Failed to run {}</b>".format(command[0]))
-            message.format_secondary_text(str(error))
-            message.run()
-            message.destroy()
+            show_error_dialog("Failed to run {}".format(command[0]), error)
+
+def show_error_dialog(title, error):
+    message = gtk.MessageDialog(
+            parent=None,
+            flags=0,
+            type=gtk.MESSAGE_ERROR,
+            buttons=gtk.BUTTONS_OK,
+    )
+    message.set_markup("<b>{}</b>".format(title))
+    message.format_secondary_text(str(error))
+    message.run()
+    message.destroy()
 
 
 def main():
@@ -1516,9 +4910,63 @@ def main():
                 os.path.basename(sys.argv[0]), __version__, sys.version_info)
         raise SystemExit
 
-    show_my_designs(
-            args['<pdb_directories>'],
-            use_cache=not args['--force'],
-            launch_gui=not args['--quiet'],
-            fork_gui=not args['--no-fork'],
-    )
+    global io_concurrency, out_of_core, use_score_files
+
+    # A server loads designs with its own settings, so these options can only
+    # be honored by loading the designs in this process.
+
+    local_options = [x for x in ('--out-of-core', '--no-score-files') if args[x]]
+    if int(args['--io-threads']) != io_concurrency:
+        local_options.append('--io-threads')
+
+    io_concurrency = int(args['--io-threads'])
+    out_of_core = args['--out-of-core']
+    use_score_files = not args['--no-score-files']
+
+    if args['--derive']:
+        parse_derived_metrics(args['--derive'])
+
+    if args['--profile']:
+        profiler.enable()
+
+    if args['--cprofile']:
+        import cProfile
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+
+    # If the GUI forks into the background, the parent process will write a
+    # report covering only the time spent loading designs.  The child process
+    # will overwrite it with a full report when the GUI is closed.
+
+    socket_path = args['--socket'] or default_socket_path
+
+    if local_options and not args['--serve']:
+        if os.path.exists(socket_path):
+            print "Not using the server on '{}', because it ignores {}.".format(
+                    socket_path, ', '.join(local_options))
+        socket_path = None
+
+    try:
+        if args['--serve']:
+            from .server import serve
+            serve(socket_path, args['<pdb_directories>'],
+                    use_cache=not args['--force'])
+        else:
+            show_my_designs(
+                    args['<pdb_directories>'],
+                    use_cache=not args['--force'],
+                    launch_gui=not args['--quiet'],
+                    fork_gui=not args['--no-fork'],
+                    memory_report=args['--memory-report'],
+                    persistent_viewer=args['--persistent-viewer'],
+                    socket_path=socket_path,
+                    export_path=args['--export'],
+                    export_filters=args['--filter'] or '',
+            )
+    finally:
+        if args['--profile']:
+            profiler.dump(args['--profile'])
+
+        if args['--cprofile']:
+            cprofiler.disable()
+            cprofiler.dump_stats(args['--cprofile'])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python2
+# encoding: utf-8
+
+"""\
+Lightweight timing instrumentation for the hot paths of show_my_designs.
+
+The instrumentation is always in place, but it costs almost nothing until
+`profiler.enable()` is called (which the `--profile` command-line option does).
+Once enabled, every instrumented function or section records how many times it
+was called and a histogram of how long each call took.
+"""
+
+import bisect, collections, json, time
+
+
+class Profiler (object):
+
+    # The upper bounds (in seconds) of the latency histogram buckets.
+    bucket_bounds = 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1e0, 1e1
+
+    def __init__(self):
+        self.enabled = False
+        self.stats = collections.OrderedDict()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.stats.clear()
+
+    def timed(self, name):
+        """
+        Decorate a function so that every call to it is timed.
+        """
+        def decorator(function): #
+            def wrapper(*args, **kwargs): #
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.time()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, time.time() - start)
+
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            wrapper.__module__ = function.__module__
+            return wrapper
+        return decorator
+
+    def section(self, name):
+        """
+        Return a context manager that times the code in its body.
+        """
+        if not self.enabled:
+            return null_section
+        return Section(self, name)
+
+    def record(self, name, seconds):
+        if name not in self.stats:
+            self.stats[name] = Stat()
+        self.stats[name].add(seconds, self.bucket_bounds)
+
+    def report(self):
+        labels = ['<{:g}s'.format(x) for x in self.bucket_bounds]
+        labels.append('>={:g}s'.format(self.bucket_bounds[-1]))
+
+        return collections.OrderedDict(
+                (name, stat.to_dict(labels))
+                for name, stat in self.stats.items())
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class Stat (object):
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = None
+
+    def add(self, seconds, bounds):
+        if self.histogram is None:
+            self.histogram = [0] * (len(bounds) + 1)
+
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.histogram[bisect.bisect_right(bounds, seconds)] += 1
+
+    def to_dict(self, labels):
+        return collections.OrderedDict([
+                ('calls', self.calls),
+                ('total', self.total),
+                ('mean', self.total / self.calls),
+                ('max', self.max),
+                ('histogram', collections.OrderedDict(
+                    zip(labels, self.histogram))),
+        ])
+
+
+class Section (object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.time() - self.start)
+
+
+class NullSection (object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+null_section = NullSection()
+profiler = Profiler()
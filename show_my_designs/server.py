@@ -0,0 +1,446 @@
+#!/usr/bin/env python2
+# encoding: utf-8
+
+"""\
+Share loaded designs between several show_my_designs processes.
+
+A server (started with `show_my_designs.py --serve`) listens on a Unix socket,
+loads designs on behalf of its clients, and keeps them in memory.  Clients get
+the metrics for each design one column at a time, so attaching to designs that
+the server has already loaded takes milliseconds instead of re-reading every
+cache.  Because only the server loads designs, only the server writes caches,
+and it never loads the same design twice at once.
+
+Messages are a 4-byte length, a JSON header, and then the raw bytes of any
+arrays listed in the header.  Messages aren't pickled, and their size is
+limited (see `gui.max_request_bytes`).  Designs are loaded with the server's
+permissions, though, and their caches are pickled.  So the server only answers
+the user running it (the socket is only accessible to that user, and each
+client's user is checked with SO_PEERCRED), and it doesn't read caches that
+anyone else could have written (see `gui.read_foreign_caches`).
+"""
+
+import collections, contextlib, errno, json, operator, os, socket, struct
+import threading
+import SocketServer
+import numpy as np, pandas as pd
+
+from . import gui
+
+
+class DesignServer (SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        SocketServer.UnixStreamServer.__init__(
+                self, socket_path, DesignRequestHandler)
+        os.chmod(socket_path, gui.socket_permissions)
+
+        self.designs = {}
+        self.stats = {}
+        self.locks = collections.defaultdict(threading.Lock)
+        self.locks_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def get_design(self, directory, use_cache=True, rescan=False):
+        """
+        Yield the design in the given directory, loading it if it hasn't been
+        loaded yet.  If `rescan` is true, the directory is listed again and
+        the design is reloaded if any of its models have changed.  Designs that
+        have already been loaded are refreshed rather than loaded from scratch,
+        see `Design.refresh()`.
+
+        The design is locked until the `with` block ends, so only one thread
+        loads (and writes the cache for) a design at a time, and a design is
+        never refreshed while another thread is reading from it.
+        """
+        directory = os.path.realpath(directory)
+
+        with self.locks_lock:
+            lock = self.locks[directory]
+
+        with lock:
+            stats = self.stats.get(directory)
+            if rescan or directory not in self.designs:
+                stats = None
+                if os.path.isdir(directory):
+                    pdb_stats, num_entries, score_stats, silent_stats = \
+                            gui.scan_pdb_directory(directory)
+                    stats = pdb_stats, score_stats, silent_stats
+
+            if not use_cache or directory not in self.designs:
+                self.designs[directory] = gui.Design(directory, use_cache)
+                self.stats[directory] = stats
+            elif self.stats[directory] != stats:
+                self.designs[directory].refresh()
+                self.stats[directory] = stats
+
+            yield self.designs[directory]
+
+
+class DesignRequestHandler (SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        if get_peer_uid(self.request) != os.getuid():
+            send_error(self.request,
+                    "only the user running the server can connect to it")
+            return
+
+        while True:
+            try:
+                request, arrays = recv_message(
+                        self.request, gui.max_request_bytes)
+            except EOFError:
+                return
+            except ValueError as error:
+                # The rest of the stream can't be parsed after a bad message,
+                # so give up on this connection.
+                send_error(self.request, str(error))
+                return
+
+            try:
+                handler = getattr(self, 'on_' + request.get('command', ''))
+            except AttributeError:
+                send_error(self.request, "unknown command: '{}'".format(
+                    request.get('command')))
+                continue
+
+            try:
+                header, arrays = handler(request, arrays)
+            except (IOError, KeyError, ValueError, RuntimeError) as error:
+                send_error(self.request, str(error))
+            else:
+                send_message(self.request, header, arrays)
+
+    def on_ping(self, request, arrays):
+        return {}, {}
+
+    def on_load(self, request, arrays):
+        with self.server.get_design(
+                request['directory'], request.get('use_cache', True),
+                rescan=True) as design:
+            header, arrays = pack_paths(design.paths)
+            header = {
+                    'num_models': len(design),
+                    'dtypes': {
+                        k: design.get_metric(k).dtype.str
+                        for k in design.metrics},
+                    'paths': header,
+            }
+        return header, arrays
+
+    def on_get_metric(self, request, arrays):
+        with self.server.get_design(request['directory']) as design:
+            values = np.asarray(design.get_metric(request['metric']))
+        return {}, {'values': values}
+
+    def on_filter(self, request, arrays):
+        with self.server.get_design(request['directory']) as design:
+            keep, num_passing = design.apply_filters(request['filters'])
+        return {'num_passing': [int(x) for x in num_passing]}, {'keep': keep}
+
+    def on_summary(self, request, arrays):
+        with self.server.get_design(request['directory']) as design:
+            return {
+                    'num_models': len(design),
+                    'metrics': sorted(design.metrics),
+                    'representative': int(design.representative),
+                    'best_model': int(design.best_model),
+                    'funnel_scores': {
+                        k: float(v) for k, v in design.funnel_scores.items()},
+            }, {}
+
+
+class DesignClient (object):
+    """
+    Make requests to a `DesignServer`.  A single client can be shared between
+    threads; requests are made one at a time.
+    """
+
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.lock = threading.Lock()
+
+    def request(self, command, **kwargs):
+        kwargs['command'] = command
+        with self.lock:
+            try:
+                send_message(self.socket, kwargs)
+                header, arrays = recv_message(
+                        self.socket, gui.max_response_bytes)
+            except EOFError:
+                raise IOError("lost connection to the server")
+
+        if 'error' in header:
+            raise IOError(header['error'])
+
+        return header, arrays
+
+    def load(self, directory, use_cache=True):
+        return self.request(
+                'load', directory=os.path.abspath(directory),
+                use_cache=use_cache)
+
+    def get_metric(self, directory, metric):
+        header, arrays = self.request(
+                'get_metric', directory=os.path.abspath(directory),
+                metric=metric)
+        return arrays['values']
+
+    def apply_filters(self, directory, filters):
+        """
+        Return the mask of the models that pass every given (name, operator,
+        threshold) filter, and the number of models that pass each filter on
+        its own, as calculated by the server.
+        """
+        header, arrays = self.request(
+                'filter', directory=os.path.abspath(directory),
+                filters=list(filters))
+        return np.array(arrays['keep']), header['num_passing']
+
+    def get_summary(self, directory):
+        header, arrays = self.request(
+                'summary', directory=os.path.abspath(directory))
+        return header
+
+    def close(self):
+        self.socket.close()
+
+
+class RemoteDesign (gui.Design):
+    """
+    A design whose models were loaded by a server.  Metrics are requested
+    from the server the first time they're used, and filters, funnel scores,
+    and the best model are calculated by the server, so filtering doesn't
+    require downloading the filtered metrics.  Notes and representatives are
+    still read and written directly, just like for any other design.
+    """
+
+    def __init__(self, client, directory, use_cache=True):
+        self.client = client
+        gui.Design.__init__(self, directory, use_cache)
+
+    def _load_models(self, use_cache):
+        header, arrays = self.client.load(self.directory, use_cache)
+        self._paths = unpack_paths(header['paths'], arrays)
+        self._models = RemoteModels(
+                self.client, self.directory,
+                header['dtypes'], header['num_models'])
+        self._load_metrics()
+
+        summary = self.client.get_summary(self.directory)
+        self._funnel_scores = {
+                str(k): v for k, v in summary['funnel_scores'].items()}
+        self._best_model = summary['best_model']
+
+    def apply_filters(self, filters):
+        # Derived metrics are calculated by the client (see
+        # gui.register_derived_metric()), so the server might not know them.
+        filters = list(filters)
+        if any(x[0] in self._derived_expressions for x in filters):
+            return gui.Design.apply_filters(self, filters)
+        return self.client.apply_filters(self.directory, filters)
+
+
+class RemoteModels (object):
+    """
+    A read-only stand-in for the data frame of metrics in a `RemoteDesign`.
+    Each column is fetched from the server the first time it's accessed.
+    """
+
+    def __init__(self, client, directory, dtypes, num_models):
+        self.client = client
+        self.directory = directory
+        self.num_models = num_models
+        self.columns = {}
+        self.dtypes = pd.Series({
+                str(k): np.dtype(str(v)) for k, v in dtypes.items()})
+
+    def __len__(self):
+        return self.num_models
+
+    def __contains__(self, column):
+        return column in self.dtypes
+
+    def __iter__(self):
+        return iter(self.dtypes.index)
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            if column not in self.dtypes:
+                raise KeyError(column)
+            self.columns[column] = pd.Series(
+                    self.client.get_metric(self.directory, column))
+        return self.columns[column]
+
+    def keys(self):
+        return list(self.dtypes.index)
+
+    @property
+    def empty(self):
+        return self.num_models == 0
+
+    def memory_usage(self, index=False, deep=False):
+        return pd.Series({
+                k: self.columns[k].nbytes if k in self.columns else 0
+                for k in self.dtypes.index})
+
+
+def serve(socket_path, directories=(), use_cache=True):
+    """
+    Run a server on the given socket until interrupted.  The given designs are
+    loaded before the server starts accepting connections.
+    """
+    # A socket file left behind by a server that crashed has to be removed
+    # before a new server can bind to it.  A socket that a server is still
+    # listening on is left alone.
+
+    if os.path.exists(socket_path):
+        if connect(socket_path) is not None:
+            raise IOError("a server is already listening on '{}'".format(socket_path))
+        os.remove(socket_path)
+
+    gui.read_foreign_caches = False
+    server = DesignServer(socket_path)
+
+    try:
+        for directory in directories:
+            try:
+                with server.get_design(directory, use_cache):
+                    pass
+            except IOError as error:
+                print "Error:", str(error)
+
+        print "Serving designs on '{}'".format(socket_path)
+        server.serve_forever()
+
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+def connect(socket_path):
+    """
+    Return a client connected to the server on the given socket, or None if
+    no server is listening there or if the server won't answer this user.
+    """
+    try:
+        client = DesignClient(socket_path)
+    except socket.error as error:
+        if error.errno in (errno.ENOENT, errno.ECONNREFUSED, errno.EACCES):
+            return None
+        raise
+
+    try:
+        client.request('ping')
+    except IOError as error:
+        print "Warning: not using the server on '{}' ({})".format(
+                socket_path, error)
+        client.close()
+        return None
+
+    return client
+
+def pack_paths(paths):
+    header = {'prefix': paths.prefix, 'suffix': paths.suffix,
+              'width': int(paths.width)}
+    arrays = {}
+    if paths.numbers is not None:
+        arrays['numbers'] = paths.numbers
+    if paths.names is not None:
+        arrays['names'] = paths.names
+    return header, arrays
+
+def unpack_paths(header, arrays):
+    paths = gui.ModelPaths([])
+    paths.prefix = str(header['prefix'])
+    paths.suffix = str(header['suffix'])
+    paths.width = header['width']
+    paths.numbers = arrays.get('numbers')
+    paths.names = arrays.get('names')
+    return paths
+
+def send_message(sock, header, arrays=None):
+    arrays = arrays or {}
+    arrays = {k: np.ascontiguousarray(v) for k, v in arrays.items()}
+
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError("can't send '{}' array of python objects".format(name))
+
+    header = dict(header, arrays=[
+        {'name': k, 'dtype': v.dtype.str, 'shape': v.shape}
+        for k, v in arrays.items()])
+    payload = json.dumps(header)
+
+    sock.sendall(struct.pack('!I', len(payload)) + payload)
+    for spec in header['arrays']:
+        sock.sendall(buffer(arrays[spec['name']]))
+
+def send_error(sock, message):
+    send_message(sock, {'error': message})
+
+def recv_message(sock, max_bytes):
+    """
+    Receive a message, raising ValueError if it's malformed or if it (the
+    header and the arrays together) is bigger than `max_bytes`.  Nothing is
+    allocated for the arrays until their sizes have been checked.
+    """
+    length, = struct.unpack('!I', recv_exactly(sock, 4))
+    if length > max_bytes:
+        raise ValueError("message header too big ({} bytes)".format(length))
+
+    try:
+        header = json.loads(str(recv_exactly(sock, length)))
+        specs = [
+                (str(x['name']), np.dtype(str(x['dtype'])), tuple(x['shape']))
+                for x in header.pop('arrays', [])]
+    except (AttributeError, KeyError, TypeError) as error:
+        raise ValueError("malformed message header ({})".format(error))
+
+    total_bytes = length
+
+    for name, dtype, shape in specs:
+        if dtype.hasobject:
+            raise ValueError("can't receive '{}' array of python objects".format(name))
+        if len(shape) > 32 or not all(
+                isinstance(x, (int, long)) and x >= 0 for x in shape):
+            raise ValueError("invalid shape for '{}' array: {}".format(name, shape))
+
+        # Python integers can't overflow, unlike np.prod().
+        total_bytes += dtype.itemsize * reduce(operator.mul, shape, 1)
+        if total_bytes > max_bytes:
+            raise ValueError("message too big (over {} bytes)".format(max_bytes))
+
+    arrays = {}
+    for name, dtype, shape in specs:
+        num_bytes = dtype.itemsize * reduce(operator.mul, shape, 1)
+        arrays[name] = np.frombuffer(
+                recv_exactly(sock, num_bytes), dtype=dtype).reshape(shape)
+
+    return header, arrays
+
+def get_peer_uid(sock):
+    """
+    Return the id of the user on the other end of the given Unix socket.
+    """
+    # Python 2 doesn't define SO_PEERCRED, but it's 17 on Linux.
+    option = getattr(socket, 'SO_PEERCRED', 17)
+    credentials = sock.getsockopt(
+            socket.SOL_SOCKET, option, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid
+
+def recv_exactly(sock, num_bytes):
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    received = 0
+
+    while received < num_bytes:
+        n = sock.recv_into(view[received:], num_bytes - received)
+        if n == 0:
+            raise EOFError
+        received += n
+
+    return buffer
@@ -0,0 +1,102 @@
+#!/usr/bin/env python2
+
+"""\
+Check that the paths written for the models in a design (when exporting them,
+or saving the paths of selected models) point to files that exist, including
+for designs stored in rosetta silent files.
+"""
+
+import gzip, os, shutil, sys, tempfile, unittest
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import run_benchmarks as benchmarks
+from show_my_designs import gui
+
+
+def write_silent_file(path, tags):
+    with open(path, 'w') as file:
+        file.write('SEQUENCE: ACDEFG\n')
+        file.write('SCORE:     score    fa_atr  rms  description\n')
+        file.write('REMARK BINARYSILENTFILE\n')
+        for i, tag in enumerate(tags):
+            file.write('SCORE: {:.3f} -900.000 {:.3f} {}\n'.format(
+                -300 + i, i / 10.0, tag))
+            file.write('ANNOTATED_SEQUENCE: ACDEFG {}\n'.format(tag))
+            for j in range(6):
+                file.write('L' + 'AbCdEf' * 20 + ' {}\n'.format(tag))
+
+
+class ModelLocationTest (unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp(prefix='show_my_designs_test_')
+
+        cls.pdb_dir = os.path.join(cls.workdir, 'pdb_design')
+        benchmarks.make_synthetic_design(cls.pdb_dir, 10, False, 5)
+
+        cls.silent_dir = os.path.join(cls.workdir, 'silent_design')
+        os.mkdir(cls.silent_dir)
+        write_silent_file(
+                os.path.join(cls.silent_dir, 'default.out'),
+                ['model_{:04d}'.format(i) for i in range(10)])
+
+        with benchmarks.quiet():
+            cls.pdb_design = gui.Design(cls.pdb_dir)
+            cls.silent_design = gui.Design(cls.silent_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workdir)
+
+    def test_pdb_locations(self):
+        self.assertFalse(self.pdb_design.is_silent)
+        paths, tags = self.pdb_design.get_model_locations([0, 3])
+        self.assertEqual(tags, [None, None])
+        for path in paths:
+            self.assertTrue(os.path.isfile(path), path)
+
+    def test_silent_locations(self):
+        self.assertTrue(self.silent_design.is_silent)
+        paths, tags = self.silent_design.get_model_locations([0, 3])
+        self.assertEqual(
+                paths, [os.path.join(self.silent_dir, 'default.out')] * 2)
+        self.assertEqual(
+                sorted(tags),
+                sorted(self.silent_design.paths[i].split('/')[1] for i in (0, 3)))
+
+    def test_format_locations(self):
+        lines = gui.format_model_locations(
+                ['/a/model.pdb', '/b/default.out'], [None, 'model_0001'])
+        self.assertEqual(lines, ['/a/model.pdb\n', '/b/default.out model_0001\n'])
+
+    def test_export_pdb_design(self):
+        path = os.path.join(self.workdir, 'pdb.csv')
+        gui.export_models(path, [self.pdb_design])
+        table = pd.read_csv(path)
+
+        self.assertNotIn('tag', table)
+        self.assertEqual(len(table), 10)
+        for x in table['path']:
+            self.assertTrue(os.path.isfile(x), x)
+
+    def test_export_silent_design(self):
+        path = os.path.join(self.workdir, 'silent.tsv.gz')
+        gui.export_models(path, [self.pdb_design, self.silent_design])
+        with gzip.open(path) as file:
+            table = pd.read_csv(file, sep='\t')
+
+        self.assertEqual(len(table), 20)
+        for x in table['path']:
+            self.assertTrue(os.path.isfile(x), x)
+
+        silent = table[table['design'] == self.silent_dir]
+        self.assertEqual(
+                sorted(silent['tag']),
+                ['model_{:04d}'.format(i) for i in range(10)])
+        self.assertTrue(table[table['design'] == self.pdb_dir]['tag'].isnull().all())
+
+
+if __name__ == '__main__':
+    unittest.main()
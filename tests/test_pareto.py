@@ -0,0 +1,102 @@
+#!/usr/bin/env python2
+
+"""\
+Check `find_pareto_front()` against a brute force search, and on the edge cases
+that the sweep has to handle specially: missing values and ties.
+"""
+
+import os, sys, unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from show_my_designs import gui
+
+
+def find_pareto_front_slowly(x, y):
+    front = np.zeros(len(x), dtype=bool)
+    finite = np.isfinite(x) & np.isfinite(y)
+
+    # Comparisons with NaN are false, which is what's wanted here.
+    with np.errstate(invalid='ignore'):
+        for i in np.flatnonzero(finite):
+            dominated = finite & (x <= x[i]) & (y <= y[i]) & \
+                    ((x < x[i]) | (y < y[i]))
+            front[i] = not dominated.any()
+
+    return front
+
+
+class ParetoFrontTest (unittest.TestCase):
+
+    def assert_front(self, x, y, expected):
+        front = gui.find_pareto_front(np.array(x, float), np.array(y, float))
+        self.assertEqual(front.tolist(), expected)
+
+    def test_simple_front(self):
+        self.assert_front(
+                [1, 2, 3, 2, 4],
+                [3, 2, 1, 3, 4],
+                [True, True, True, False, False])
+
+    def test_empty(self):
+        self.assert_front([], [], [])
+
+    def test_nan_in_x_with_good_y(self):
+        # Lower is better, so the NaN used to be treated as +inf and the point
+        # still made it onto the front because of its y.
+        self.assert_front(
+                [np.nan, 1, 2],
+                [0, 2, 1],
+                [False, True, True])
+
+    def test_nan_in_y_with_good_x(self):
+        self.assert_front(
+                [0, 1, 2],
+                [np.nan, 2, 1],
+                [False, True, True])
+
+    def test_infinite_values(self):
+        self.assert_front(
+                [-np.inf, 1, 2, 0],
+                [5, 2, 1, np.inf],
+                [False, True, True, False])
+
+    def test_all_missing(self):
+        self.assert_front([np.nan, 1], [1, np.nan], [False, False])
+
+    def test_identical_points_on_front(self):
+        self.assert_front(
+                [1, 2, 1, 3],
+                [2, 1, 2, 3],
+                [True, True, True, False])
+
+    def test_identical_points_off_front(self):
+        self.assert_front(
+                [1, 2, 2, 2],
+                [1, 2, 2, 3],
+                [True, False, False, False])
+
+    def test_ties_in_one_metric(self):
+        # Points that tie on one metric and lose on the other are dominated.
+        self.assert_front(
+                [1, 1, 2, 3],
+                [3, 4, 1, 1],
+                [True, False, True, False])
+
+    def test_matches_brute_force(self):
+        random = np.random.RandomState(0)
+
+        for i in range(50):
+            # Round the values so that there are plenty of ties.
+            x = random.randint(0, 8, size=40).astype(float)
+            y = random.randint(0, 8, size=40).astype(float)
+            x[random.rand(40) < 0.1] = np.nan
+            y[random.rand(40) < 0.1] = np.nan
+
+            np.testing.assert_array_equal(
+                    gui.find_pareto_front(x, y),
+                    find_pareto_front_slowly(x, y))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python2
+
+"""\
+Check that each action in the GUI redraws the plot exactly once, no matter how
+many times the action asks for the plot to be updated.  The plot is redrawn
+when the main loop is idle (see `ShowMyDesigns.update_plot()`), so these tests
+queue the idle callbacks and run them one cycle at a time.
+"""
+
+import os, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+import run_benchmarks as benchmarks
+from show_my_designs import gui
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+class RedrawHost (benchmarks.BenchmarkHost):
+    """
+    Provide the state that the plot-related event handlers of `ShowMyDesigns`
+    need, without creating a window.
+    """
+
+    update_plot = gui.ShowMyDesigns.update_plot.im_func
+    redraw_plot = gui.ShowMyDesigns.redraw_plot.im_func
+    get_plot_state = gui.ShowMyDesigns.get_plot_state.im_func
+    on_select_designs = gui.ShowMyDesigns.on_select_designs.im_func
+    on_change_x_metric = gui.ShowMyDesigns.on_change_x_metric.im_func
+    on_change_y_metric = gui.ShowMyDesigns.on_change_y_metric.im_func
+
+    def __init__(self, designs, filter_pane):
+        benchmarks.BenchmarkHost.__init__(self, designs, filter_pane)
+        self.keys = []
+        self.is_plot_dirty = False
+        self.num_redraws = 0
+        self.prerendered_plots = {}
+
+        figure = Figure(figsize=(8, 6))
+        self.canvas = FigureCanvasAgg(figure)
+        self.canvas.prerendered = None
+        self.axes = figure.add_axes(gui.plot_position)
+        self.histogram_axes = None
+
+    def set_title(self, title):
+        pass
+
+    def update_annotations(self):
+        pass
+
+    def prebuild_model_menus(self):
+        return False
+
+    def prerender_neighbors(self):
+        return False
+
+
+class FakeSelection (object):
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_selected_rows(self):
+        return self, [(i,) for i in range(len(self.keys))]
+
+    def get_iter(self, path):
+        return path[0]
+
+    def get_value(self, iter, column):
+        return self.keys[iter]
+
+
+class FakeComboBox (object):
+
+    def __init__(self, text):
+        self.text = text
+
+    def get_active_text(self):
+        return self.text
+
+
+class RedrawTest (unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp(prefix='show_my_designs_test_')
+        cls.designs = {}
+
+        for i in range(3):
+            directory = os.path.join(cls.workdir, 'design_{}'.format(i))
+            benchmarks.make_synthetic_design(directory, 50, False, 5, seed=i)
+            with benchmarks.quiet():
+                cls.designs[directory] = gui.Design(directory)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workdir)
+
+    def setUp(self):
+        self.idle_callbacks = []
+        self.idle_add = gui.gobject.idle_add
+        gui.gobject.idle_add = lambda f, *args: \
+                self.idle_callbacks.append((f, args))
+
+        self.filter = benchmarks.BenchmarkFilter('loop_rmsd', '<', '3')
+        self.host = RedrawHost(
+                self.designs, benchmarks.BenchmarkFilterPane([self.filter]))
+
+        # Start with one design plotted, and nothing left to do.
+        self.host.on_select_designs(FakeSelection(sorted(self.designs)[:1]))
+        self.run_idle_cycle()
+
+    def tearDown(self):
+        gui.gobject.idle_add = self.idle_add
+
+    def run_idle_cycle(self):
+        """
+        Run the callbacks that were queued before this cycle started.  Callbacks
+        queued by those callbacks are left for the next cycle.
+        """
+        callbacks, self.idle_callbacks = self.idle_callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+    def assert_redraws(self, expected):
+        before = self.host.num_redraws
+        self.run_idle_cycle()
+        self.assertEqual(self.host.num_redraws - before, expected)
+
+    def test_idle_without_changes(self):
+        self.assert_redraws(0)
+
+    def test_filter_change(self):
+        # Editing a filter emits 'updated' from both the filter and the pane.
+        self.filter.threshold = '2'
+        self.host.update_plot()
+        self.host.update_plot()
+        self.assert_redraws(1)
+        self.assert_redraws(0)
+
+    def test_axis_change(self):
+        self.host.on_change_x_metric(FakeComboBox('delta_buried_unsats'))
+        self.host.on_change_y_metric(FakeComboBox('loop_rmsd'))
+        self.assert_redraws(1)
+        self.assert_redraws(0)
+
+    def test_select_several_designs(self):
+        self.host.on_select_designs(FakeSelection(sorted(self.designs)))
+        self.assertEqual(len(self.host.keys), 3)
+        self.assert_redraws(1)
+        self.assert_redraws(0)
+
+    def test_changes_in_separate_cycles(self):
+        self.host.on_change_x_metric(FakeComboBox('delta_buried_unsats'))
+        self.assert_redraws(1)
+        self.host.on_select_designs(FakeSelection(sorted(self.designs)))
+        self.assert_redraws(1)
+
+
+if __name__ == '__main__':
+    unittest.main()